@@ -0,0 +1,236 @@
+# cache.py
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    # Unicode-normalize and collapse whitespace so trivially different copies share a key
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """
+    Append-only on-disk store for one model's embeddings, shared by every
+    process using the same directory.
+
+    Vectors live in a flat float32 file that is read through a memory map.
+    index.log maps text hashes to row numbers, one "hash row" line per
+    vector. Writers append the vectors, then their index lines, under an
+    exclusive flock, so a line never points at a row that isn't fully
+    written; readers pick up other processes' lines by reading the log
+    from where they last stopped.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.log_path = os.path.join(directory, "index.log")
+        self.meta_path = os.path.join(directory, "meta.json")
+        os.makedirs(directory, exist_ok=True)
+
+        self.dim = None
+        self.rows = {}
+        self._log_offset = 0
+        self._mmap = None
+        self._lock = threading.Lock()
+        self._refresh()
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_meta(self, dim: int):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": dim}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _refresh(self):
+        # Read index lines appended since the last refresh; a torn last line waits for the next one
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].decode("utf-8").splitlines():
+            key, row = line.split()
+            self.rows[key] = int(row)
+        self._log_offset += complete
+
+    def _matrix(self, row: int):
+        # Remap when another process has appended rows since the file was mapped
+        if self._mmap is None or row >= self._mmap.shape[0]:
+            n_rows = os.path.getsize(self.vectors_path) // (4 * self.dim)
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim))
+        return self._mmap
+
+    def get(self, key: str):
+        with self._lock:
+            row = self.rows.get(key)
+            if row is None:
+                self._refresh()
+                row = self.rows.get(key)
+            if row is None:
+                return None
+            matrix = self._matrix(row)
+            if row >= matrix.shape[0]:
+                return None
+            return np.array(matrix[row])
+
+    def put_many(self, items):
+        with self._lock, self._locked():
+            # Another process may have stored some of these since our last refresh
+            self._refresh()
+            items = [(key, vec) for key, vec in items if key not in self.rows]
+            if not items:
+                return
+            if self.dim is None:
+                self.dim = int(items[0][1].shape[0])
+                self._write_meta(self.dim)
+
+            # Rows are addressed by file position; drop a torn partial row left by a crashed writer
+            start = 0
+            if os.path.exists(self.vectors_path):
+                start = os.path.getsize(self.vectors_path) // (4 * self.dim)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(start * 4 * self.dim)
+                for _, vec in items:
+                    f.write(np.ascontiguousarray(vec, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.writelines(f"{key} {start + offset}\n" for offset, (key, _) in enumerate(items))
+            self._refresh()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model id, normalized text hash).
+
+    Keeps a bounded in-memory LRU tier and, if disk_dir is given, a persistent
+    memory-mapped tier per model so embeddings survive restarts.
+    """
+
+    def __init__(self, max_entries: int = 10000, disk_dir: str = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._memory = OrderedDict()
+        self._disk = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_tier(self, model_id: str):
+        if not self.disk_dir:
+            return None
+        if model_id not in self._disk:
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_id)
+            self._disk[model_id] = _DiskTier(os.path.join(self.disk_dir, safe_name))
+        return self._disk[model_id]
+
+    def _remember(self, key, vec):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model_id: str, texts, compute):
+        """
+        Returns embeddings for texts, computing only the ones not cached.
+
+        Args:
+            model_id: Identifier of the model producing the embeddings.
+            texts: A list of strings to embed.
+            compute: A function taking a list of texts and returning one vector per text.
+
+        Returns:
+            A float32 NumPy matrix with one row per input text.
+        """
+        keys = [text_hash(text) for text in texts]
+        found = {}
+        missing = {}
+
+        with self._lock:
+            disk = self._disk_tier(model_id)
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                vec = self._memory.get((model_id, key))
+                if vec is not None:
+                    self._memory.move_to_end((model_id, key))
+                    self.hits += 1
+                    found[key] = vec
+                    continue
+                vec = disk.get(key) if disk is not None else None
+                if vec is not None:
+                    self.disk_hits += 1
+                    self._remember((model_id, key), vec)
+                    found[key] = vec
+                    continue
+                self.misses += 1
+                missing[key] = text
+
+        if missing:
+            vectors = np.asarray(compute(list(missing.values())), dtype=np.float32)
+            computed = list(zip(missing.keys(), vectors))
+            with self._lock:
+                for key, vec in computed:
+                    self._remember((model_id, key), vec)
+                    found[key] = vec
+                disk = self._disk_tier(model_id)
+            # Outside the memory-tier lock: readers of cached embeddings don't wait for the disk write
+            if disk is not None:
+                disk.put_many(computed)
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def scope(self, model_id: str):
+        return ScopedEmbeddingCache(self, model_id)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self._memory),
+        }
+
+
+class ScopedEmbeddingCache:
+    """An EmbeddingCache view bound to a single model id."""
+
+    def __init__(self, cache: EmbeddingCache, model_id: str):
+        self.cache = cache
+        self.model_id = model_id
+
+    def get_many(self, texts, compute):
+        return self.cache.get_many(self.model_id, texts, compute)
@@ -0,0 +1,262 @@
+# cosmos.py
+"""
+Cosmos DB access for master and student answers.
+
+Every query is parameterized and projects only the fields grading reads
+(userId, answerText). Reads are cross-partition queries unless the
+containers' partition key paths are configured (COSMOS_MASTER_PARTITION_KEY,
+COSMOS_STUDENT_PARTITION_KEY); then a single student's answer is a point
+read by its id, "{userId}-{questionId}", whenever the key can be derived,
+and a whole class is read from one partition when the container is
+partitioned by questionId. A configured key that turns out to be wrong
+still finds items through a cross-partition fallback and is logged, both by
+check_partition_keys at startup and on the first fallback hit. Classes are
+consumed page by page. The async functions take azure.cosmos.aio
+containers from one shared CosmosConnection per process.
+"""
+
+import logging
+import os
+
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+COSMOS_ENDPOINT = os.getenv("COSMOS_ENDPOINT")
+COSMOS_KEY = os.getenv("COSMOS_KEY")
+DATABASE_NAME = "tutor"
+MASTER_CONTAINER_NAME = "masteranswer"
+STUDENT_CONTAINER_NAME = "studentanswer"
+
+# Partition key paths of the two containers (e.g. "/questionId"); unset means cross-partition queries
+MASTER_PARTITION_KEY = os.getenv("COSMOS_MASTER_PARTITION_KEY", "")
+STUDENT_PARTITION_KEY = os.getenv("COSMOS_STUDENT_PARTITION_KEY", "")
+COSMOS_PAGE_SIZE = int(os.getenv("COSMOS_PAGE_SIZE", "100"))
+# Connections kept open by the shared async client
+COSMOS_POOL_SIZE = int(os.getenv("COSMOS_POOL_SIZE", "50"))
+
+MASTER_QUERY = "SELECT TOP 1 c.answerText FROM c WHERE c.questionId = @questionId"
+STUDENT_QUERY = "SELECT c.userId, c.answerText FROM c WHERE c.questionId = @questionId AND c.userId = @userId"
+CLASS_QUERY = "SELECT c.userId, c.answerText FROM c WHERE c.questionId = @questionId"
+SAMPLE_QUERY = "SELECT TOP 1 c.id, c.questionId, c.userId FROM c"
+
+_partition_key_warnings = set()
+
+
+def student_item_id(user_id: str, question_id: str) -> str:
+    # Same composite id the node backend writes
+    return f"{user_id}-{question_id}"
+
+
+def _partition_key(path: str, **fields):
+    # Partition key value of a document with these fields, or None if the path isn't one of them
+    return fields.get(path.lstrip("/")) if path else None
+
+
+def _warn_partition_key(setting: str, path: str):
+    # Logged once per setting: the item exists, just not in the partition the setting points at
+    if setting not in _partition_key_warnings:
+        _partition_key_warnings.add(setting)
+        logger.warning(
+            "%s=%s does not match the container's partition key: an item missing from its partition was "
+            "found by a cross-partition query. Fix or unset the setting.", setting, path,
+        )
+
+
+def _params(**values):
+    return [{"name": f"@{name}", "value": value} for name, value in values.items()]
+
+
+def _answer(item: dict) -> dict:
+    return {"userId": item.get("userId"), "answerText": item.get("answerText")}
+
+
+def _sync_query(container, query: str, parameters, partition_key, page_size: int = None):
+    kwargs = {"partition_key": partition_key} if partition_key is not None else {"enable_cross_partition_query": True}
+    return container.query_items(query=query, parameters=parameters, max_item_count=page_size, **kwargs)
+
+
+def _async_query(container, query: str, parameters, partition_key, page_size: int = None):
+    # The aio client fans out across partitions by itself when no partition key is given
+    kwargs = {"partition_key": partition_key} if partition_key is not None else {}
+    return container.query_items(query=query, parameters=parameters, max_item_count=page_size, **kwargs)
+
+
+def read_master_answer(container, question_id: str):
+    """Returns the master answer text for a question, or None."""
+    partition_key = _partition_key(MASTER_PARTITION_KEY, questionId=question_id)
+    for item in _sync_query(container, MASTER_QUERY, _params(questionId=question_id), partition_key, 1):
+        return item.get("answerText")
+    if partition_key is not None:
+        for item in _sync_query(container, MASTER_QUERY, _params(questionId=question_id), None, 1):
+            _warn_partition_key("COSMOS_MASTER_PARTITION_KEY", MASTER_PARTITION_KEY)
+            return item.get("answerText")
+    return None
+
+
+def read_student_answer(container, question_id: str, user_id: str):
+    """
+    Returns {"userId", "answerText"} for one student, or None.
+
+    Point read by id when the partition key is known (1 RU for a small
+    document); documents written under another id are still found by a
+    single-partition query, and by a cross-partition one if the configured
+    partition key is wrong.
+    """
+    partition_key = _partition_key(STUDENT_PARTITION_KEY, questionId=question_id, userId=user_id,
+                                   id=student_item_id(user_id, question_id))
+    if partition_key is not None:
+        try:
+            return _answer(container.read_item(item=student_item_id(user_id, question_id), partition_key=partition_key))
+        except CosmosResourceNotFoundError:
+            logger.debug("No student document with id %s; querying instead", student_item_id(user_id, question_id))
+    params = _params(questionId=question_id, userId=user_id)
+    for item in _sync_query(container, STUDENT_QUERY, params, partition_key, 1):
+        return _answer(item)
+    if partition_key is not None:
+        for item in _sync_query(container, STUDENT_QUERY, params, None, 1):
+            _warn_partition_key("COSMOS_STUDENT_PARTITION_KEY", STUDENT_PARTITION_KEY)
+            return _answer(item)
+    return None
+
+
+def iter_class_answers(container, question_id: str, page_size: int = COSMOS_PAGE_SIZE):
+    """Yields the student answers for a question one page (list of {"userId", "answerText"}) at a time."""
+    partition_key = _partition_key(STUDENT_PARTITION_KEY, questionId=question_id)
+    found = False
+    pages = _sync_query(container, CLASS_QUERY, _params(questionId=question_id), partition_key, page_size).by_page()
+    for page in pages:
+        answers = [_answer(item) for item in page]
+        found = found or bool(answers)
+        yield answers
+    if partition_key is not None and not found:
+        for page in _sync_query(container, CLASS_QUERY, _params(questionId=question_id), None, page_size).by_page():
+            answers = [_answer(item) for item in page]
+            if answers:
+                _warn_partition_key("COSMOS_STUDENT_PARTITION_KEY", STUDENT_PARTITION_KEY)
+            yield answers
+
+
+async def aread_master_answer(container, question_id: str):
+    """Async variant of read_master_answer for azure.cosmos.aio containers."""
+    partition_key = _partition_key(MASTER_PARTITION_KEY, questionId=question_id)
+    async for item in _async_query(container, MASTER_QUERY, _params(questionId=question_id), partition_key, 1):
+        return item.get("answerText")
+    if partition_key is not None:
+        async for item in _async_query(container, MASTER_QUERY, _params(questionId=question_id), None, 1):
+            _warn_partition_key("COSMOS_MASTER_PARTITION_KEY", MASTER_PARTITION_KEY)
+            return item.get("answerText")
+    return None
+
+
+async def aread_student_answer(container, question_id: str, user_id: str):
+    """Async variant of read_student_answer."""
+    partition_key = _partition_key(STUDENT_PARTITION_KEY, questionId=question_id, userId=user_id,
+                                   id=student_item_id(user_id, question_id))
+    if partition_key is not None:
+        try:
+            item = await container.read_item(item=student_item_id(user_id, question_id), partition_key=partition_key)
+            return _answer(item)
+        except CosmosResourceNotFoundError:
+            logger.debug("No student document with id %s; querying instead", student_item_id(user_id, question_id))
+    params = _params(questionId=question_id, userId=user_id)
+    async for item in _async_query(container, STUDENT_QUERY, params, partition_key, 1):
+        return _answer(item)
+    if partition_key is not None:
+        async for item in _async_query(container, STUDENT_QUERY, params, None, 1):
+            _warn_partition_key("COSMOS_STUDENT_PARTITION_KEY", STUDENT_PARTITION_KEY)
+            return _answer(item)
+    return None
+
+
+async def aiter_class_answers(container, question_id: str, page_size: int = COSMOS_PAGE_SIZE):
+    """Async variant of iter_class_answers."""
+    partition_key = _partition_key(STUDENT_PARTITION_KEY, questionId=question_id)
+    found = False
+    pages = _async_query(container, CLASS_QUERY, _params(questionId=question_id), partition_key, page_size).by_page()
+    async for page in pages:
+        answers = [_answer(item) async for item in page]
+        found = found or bool(answers)
+        yield answers
+    if partition_key is not None and not found:
+        async for page in _async_query(container, CLASS_QUERY, _params(questionId=question_id), None, page_size).by_page():
+            answers = [_answer(item) async for item in page]
+            if answers:
+                _warn_partition_key("COSMOS_STUDENT_PARTITION_KEY", STUDENT_PARTITION_KEY)
+            yield answers
+
+
+async def check_partition_keys(master_container, student_container):
+    """
+    Startup check of the configured partition keys: samples one item from
+    each container with a cross-partition query and looks it up again in
+    the partition its key setting derives. A miss is logged as an error,
+    since every partition-scoped read would otherwise come back empty.
+    """
+    checks = (
+        ("COSMOS_MASTER_PARTITION_KEY", MASTER_PARTITION_KEY, master_container, MASTER_QUERY),
+        ("COSMOS_STUDENT_PARTITION_KEY", STUDENT_PARTITION_KEY, student_container, STUDENT_QUERY),
+    )
+    for setting, path, container, query in checks:
+        if not path:
+            continue
+        try:
+            sample = None
+            async for item in _async_query(container, SAMPLE_QUERY, [], None, 1):
+                sample = item
+                break
+            if sample is None:
+                continue
+            params = _params(questionId=sample.get("questionId"), userId=sample.get("userId"))
+            if query is MASTER_QUERY:
+                params = params[:1]
+            partition_key = _partition_key(path, **sample)
+            found = False
+            if partition_key is not None:
+                async for _ in _async_query(container, query, params, partition_key, 1):
+                    found = True
+                    break
+            if not found:
+                logger.error(
+                    "%s=%s does not match the container: item %s was found by a cross-partition query but not in "
+                    "its partition. Reads will fall back to cross-partition queries.", setting, path, sample.get("id"),
+                )
+        except Exception:
+            logger.exception("Could not check %s.", setting)
+
+
+class CosmosConnection:
+    """
+    One azure.cosmos.aio client per process, on an aiohttp session whose
+    connector keeps up to COSMOS_POOL_SIZE connections alive. Open it
+    inside the running event loop (app startup) and close it on shutdown.
+    """
+
+    def __init__(self, endpoint: str = COSMOS_ENDPOINT, key: str = COSMOS_KEY, pool_size: int = COSMOS_POOL_SIZE):
+        self.endpoint = endpoint
+        self.key = key
+        self.pool_size = pool_size
+        self.client = None
+        self.master_container = None
+        self.student_container = None
+        self._session = None
+
+    async def open(self):
+        import aiohttp
+        from azure.core.pipeline.transport import AioHttpTransport
+        from azure.cosmos.aio import CosmosClient
+
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        transport = AioHttpTransport(session=self._session, session_owner=False)
+        self.client = CosmosClient(self.endpoint, self.key, transport=transport)
+        database = self.client.get_database_client(DATABASE_NAME)
+        self.master_container = database.get_container_client(MASTER_CONTAINER_NAME)
+        self.student_container = database.get_container_client(STUDENT_CONTAINER_NAME)
+        return self
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+        if self._session is not None:
+            await self._session.close()
+        self.client = self._session = None
@@ -0,0 +1,157 @@
+# duplicates.py
+"""
+Near-duplicate detection among the student answers of one question.
+
+Answers are embedded with SBERT and clustered greedily: each answer joins
+the first earlier cluster representative it matches at or above
+NEAR_DUPLICATE_THRESHOLD cosine similarity, otherwise it starts a cluster
+of its own. The grading pipeline reuses a representative's extraction and
+feedback for the rest of its cluster, and the clusters with more than one
+member are reported as a copy signal.
+"""
+
+import logging
+import os
+import re
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Reuse a representative's extraction/feedback for near-duplicate answers (0 to grade every answer in full)
+NEAR_DUPLICATE_REUSE = os.getenv("NEAR_DUPLICATE_REUSE", "1") == "1"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.97"))
+# Feedback is regenerated when a duplicate's final score differs from its representative's by more than this
+NEAR_DUPLICATE_MAX_SCORE_DELTA = float(os.getenv("NEAR_DUPLICATE_MAX_SCORE_DELTA", "1.0"))
+# "numpy" (exact, brute force) or "hnsw" (approximate, needs hnswlib from requirements-optional.txt)
+NEAR_DUPLICATE_INDEX = os.getenv("NEAR_DUPLICATE_INDEX", "numpy")
+
+# Whitespace-separated tokens that carry math: digits, operators or an equals sign
+_MATH_TOKEN_RE = re.compile(r"\S*[0-9=+\-*/^]\S*")
+
+
+class EmbeddingIndex:
+    """
+    Exact cosine-similarity index over L2-normalized vectors, searched with
+    one matrix-vector product.
+    """
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.keys = []
+
+    def add(self, key, vector):
+        if len(self.keys) == len(self._vectors):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+        self._vectors[len(self.keys)] = vector
+        self.keys.append(key)
+
+    def nearest(self, vector):
+        """Returns (key, similarity) of the closest indexed vector, or (None, 0.0) when empty."""
+        if not self.keys:
+            return None, 0.0
+        scores = self._vectors[:len(self.keys)] @ vector
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+
+class HnswIndex:
+    """Approximate variant of EmbeddingIndex on an hnswlib graph, for very large classes."""
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        import hnswlib
+
+        self._index = hnswlib.Index(space="cosine", dim=dim)
+        self._index.init_index(max_elements=capacity, ef_construction=200, M=16)
+        self._index.set_ef(64)
+        self.keys = []
+
+    def add(self, key, vector):
+        if len(self.keys) == self._index.get_max_elements():
+            self._index.resize_index(2 * len(self.keys))
+        self._index.add_items(vector[None, :], [len(self.keys)])
+        self.keys.append(key)
+
+    def nearest(self, vector):
+        if not self.keys:
+            return None, 0.0
+        labels, distances = self._index.knn_query(vector[None, :], k=1)
+        # hnswlib's cosine distance is 1 - similarity
+        return self.keys[int(labels[0][0])], 1.0 - float(distances[0][0])
+
+
+def make_index(dim: int, backend: str = NEAR_DUPLICATE_INDEX):
+    if backend == "hnsw":
+        try:
+            return HnswIndex(dim)
+        except ImportError:
+            logger.warning("NEAR_DUPLICATE_INDEX=hnsw but hnswlib is not installed; using the exact NumPy index.")
+    return EmbeddingIndex(dim)
+
+
+def math_signature(text: str):
+    """
+    The math-bearing tokens of an answer, in order. Two answers with the same
+    prose but a different equation embed almost identically, so reuse also
+    requires equal signatures.
+    """
+    return [token.rstrip(".,;:") for token in _MATH_TOKEN_RE.findall(text)]
+
+
+def cluster_near_duplicates(keys, vectors, threshold: float = NEAR_DUPLICATE_THRESHOLD, backend: str = NEAR_DUPLICATE_INDEX):
+    """
+    Greedily clusters answers by embedding similarity.
+
+    Args:
+        keys: One identifier per answer, in grading order.
+        vectors: A matrix with one embedding row per answer.
+        threshold: Minimum cosine similarity to a representative to join its cluster.
+        backend: "numpy" or "hnsw" (see make_index).
+
+    Returns:
+        A dict mapping every key to (representative key, similarity); a
+        representative maps to itself with similarity 1.0.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(keys) == 0:
+        return {}
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    index = make_index(vectors.shape[1], backend)
+    assignment = {}
+    for key, vector in zip(keys, vectors):
+        representative, similarity = index.nearest(vector)
+        if representative is not None and similarity >= threshold:
+            assignment[key] = (representative, similarity)
+        else:
+            index.add(key, vector)
+            assignment[key] = (key, 1.0)
+    return assignment
+
+
+def duplicate_clusters(assignment: dict, labels: dict = None):
+    """
+    Clusters with more than one member, for reporting.
+
+    Args:
+        assignment: The output of cluster_near_duplicates.
+        labels: Optional mapping from key to a display label (e.g. the userId).
+
+    Returns:
+        A list of {"representative", "members", "min_similarity"}, largest first.
+    """
+    labels = labels or {}
+    groups = {}
+    for key, (representative, similarity) in assignment.items():
+        groups.setdefault(representative, []).append((key, similarity))
+    clusters = [
+        {
+            "representative": labels.get(representative, representative),
+            "members": [labels.get(key, key) for key, _ in members],
+            "min_similarity": round(min(similarity for _, similarity in members), 4),
+        }
+        for representative, members in groups.items()
+        if len(members) > 1
+    ]
+    return sorted(clusters, key=lambda cluster: -len(cluster["members"]))
@@ -0,0 +1,144 @@
+# encoders.py
+
+import logging
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# CPU inference backend for SBERT and E5:
+#   "torch": fp32 PyTorch (default)
+#   "int8":  PyTorch with dynamically int8-quantized Linear layers
+#   "onnx":  ONNX Runtime (E5 is exported once and cached under ONNX_CACHE_DIR;
+#            SBERT uses sentence-transformers' own ONNX backend, which needs optimum;
+#            both come from requirements-optional.txt)
+ENCODER_BACKENDS = ("torch", "int8", "onnx")
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "storage/onnx")
+ONNX_OPSET = 17
+
+if ENCODER_BACKEND not in ENCODER_BACKENDS:
+    raise ValueError(f"ENCODER_BACKEND must be one of {ENCODER_BACKENDS}, got {ENCODER_BACKEND!r}")
+
+
+def quantize_int8(model):
+    """
+    Replaces every nn.Linear with a dynamically quantized int8 version
+    (weights stored as int8, activations quantized per batch). Attention and
+    feed-forward layers hold almost all of a BERT's weights, so this roughly
+    quarters their memory and uses the int8 CPU kernels.
+    """
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+class OnnxEncoder:
+    """
+    Runs an exported transformer encoder with ONNX Runtime.
+
+    Called like the transformers model it replaces (model(**inputs) with
+    PyTorch tensors) and returns an object with a last_hidden_state tensor,
+    so encode_e5 works unchanged.
+    """
+
+    def __init__(self, path: str, num_threads: int = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Same intra-op thread budget as torch (TORCH_NUM_THREADS)
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def __call__(self, **inputs):
+        feed = {
+            name: np.asarray(tensor, dtype=np.int64)
+            for name, tensor in inputs.items()
+            if name in self.input_names
+        }
+        (hidden,) = self.session.run(["last_hidden_state"], feed)
+        return SimpleNamespace(last_hidden_state=torch.from_numpy(hidden))
+
+
+def onnx_path(model_name: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "--") + ".onnx")
+
+
+class _LastHiddenState(torch.nn.Module):
+    # Positional-inputs wrapper for the TorchScript exporter, returning only last_hidden_state
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs))).last_hidden_state
+
+
+def export_onnx(model, tokenizer, path: str):
+    """
+    Exports a transformers encoder to ONNX with dynamic batch and sequence
+    axes. Written to a temporary file and renamed, so worker processes
+    starting together never load a half-written graph.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    sample = tokenizer(["query: sample input"], return_tensors="pt")
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(model, input_names),
+            tuple(sample[name] for name in input_names),
+            tmp_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+            dynamo=False,
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_sbert(model_name: str, backend: str = ENCODER_BACKEND):
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    model = SentenceTransformer(model_name)
+    return quantize_int8(model) if backend == "int8" else model
+
+
+def load_e5(model_name: str, load_torch_model, tokenizer=None, backend: str = ENCODER_BACKEND):
+    """
+    Loads the E5 encoder for the given backend.
+
+    Args:
+        model_name: Hugging Face model id or local path.
+        load_torch_model: Zero-argument function returning the fp32 PyTorch model.
+        tokenizer: Tokenizer used for the sample input when exporting to ONNX.
+        backend: One of ENCODER_BACKENDS.
+
+    Returns:
+        A model callable as model(**inputs) returning last_hidden_state.
+    """
+    if backend == "onnx":
+        path = onnx_path(model_name)
+        if not os.path.exists(path):
+            if tokenizer is None:
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(model_name)
+            logger.info("Exporting %s to ONNX at %s", model_name, path)
+            export_onnx(load_torch_model(), tokenizer, path)
+        return OnnxEncoder(path)
+
+    model = load_torch_model()
+    return quantize_int8(model) if backend == "int8" else model
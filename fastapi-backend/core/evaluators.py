@@ -1,75 +1,133 @@
 # evaluators.py
 
-from langchain_core.documents import Document
+import logging
+
 import numpy as np
 
-def score_equations(master_extractions, student_extractions, embedding_model):
+from core import metrics
+from core.matching import prematch_equations, record_stages
+
+logger = logging.getLogger(__name__)
+
+
+def equation_text(eq):
+    # Combine raw equation and description for better matching
+    return f"{eq['equation']}. Description: {eq['description']}"
+
+
+def embed_texts(texts, embedding_model, cache=None):
+    """
+    Embeds a list of texts with a single batched call, embedding each
+    distinct text exactly once.
+
+    Args:
+        texts: A list of strings to embed (duplicates allowed).
+        embedding_model: The embedding model to use (must provide embed_documents).
+        cache: Optional scoped embedding cache; only uncached texts are sent to the model.
+
+    Returns:
+        A float32 NumPy matrix with one row per input text.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    if not unique_texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    with metrics.timed("embedding"):
+        if cache is not None:
+            vectors = cache.get_many(unique_texts, embedding_model.embed_documents)
+        else:
+            vectors = np.asarray(embedding_model.embed_documents(unique_texts), dtype=np.float32)
+    row_of = {text: i for i, text in enumerate(unique_texts)}
+    return vectors[[row_of[text] for text in texts]]
+
+
+def score_equations(master_extractions, student_extractions, embedding_model, cache=None, master_vectors=None, prematch=True):
     """
     Scores student equations against master equations using embedding similarity.
 
+    Master equations are first resolved locally (exact normalized match, then
+    symbolic equivalence); only the ones left unmatched go to the embedding
+    scorer. There, every distinct equation is embedded once and the best
+    student match per master equation comes from a single matrix product.
+
     Args:
         master_extractions: A list of dictionaries representing master equations.
         student_extractions: A list of dictionaries representing student equations.
         embedding_model: The embedding model to use for similarity comparison.
+        cache: Optional scoped embedding cache shared across requests.
+        master_vectors: Optional precomputed master equation embeddings (one row per
+                        master extraction), e.g. from a cached master profile.
+        prematch: Whether to run the local exact/symbolic matching stage first.
 
     Returns:
         A dictionary containing the final equation score, total unique master equations,
-        and a feedback matrix.
+        a feedback matrix and how many master equations each matching stage resolved.
     """
     # Set to store unique master equations
-    master_unique_extractions = set()
-    print("Master Extractions:")
-    for item in master_extractions:
-        master_unique_extractions.add(item['equation'])
-        print(f" - Equation: {item['equation']}")
-        print(f"   Description: {item['description']}\n")
-
-    print("Student Extractions:")
-    for item in student_extractions:
-        print(f" - Equation: {item['equation']}")
-        print(f"   Description: {item['description']}\n")
+    master_unique_extractions = {item['equation'] for item in master_extractions}
+
+    logger.debug(
+        "Scoring equations",
+        extra={"master_equations": len(master_extractions), "student_equations": len(student_extractions)},
+    )
 
-    # Combine raw equation and description for better matching
-    master_docs = [
-        Document(
-            page_content=f"{eq['equation']}. Description: {eq['description']}",
-            metadata={"equation": eq['equation'], "description": eq['description']}
-        )
-        for eq in master_extractions
-    ]
-
-    score = 0
     matched_equations = set()
     total = len(master_unique_extractions)
     feedback_matrix = []
 
-    print("\n🔍 Equation Matching Details (Best Match Strategy):")
+    master_texts = [equation_text(eq) for eq in master_extractions]
+    student_texts = [equation_text(eq) for eq in student_extractions]
 
-    for master_eq in master_extractions:
-        master_query = f"{master_eq['equation']}. Description: {master_eq['description']}"
-        master_vec = embedding_model.embed_query(master_query)
+    best_indices = np.zeros(len(master_texts), dtype=int)
+    best_scores = np.zeros(len(master_texts), dtype=np.float32)
 
-        best_sim_score = 0
-        best_student_eq = None
+    # Local stage: exact and symbolic matches need no embeddings
+    if prematch:
+        local_matches, stages = prematch_equations(master_extractions, student_extractions)
+    else:
+        local_matches, stages = {}, {"exact": 0, "symbolic": 0}
+    for i, (j, _) in local_matches.items():
+        best_indices[i] = j
+        best_scores[i] = 1.0
+    remaining = [i for i in range(len(master_texts)) if i not in local_matches]
 
-        for student_eq in student_extractions:
-            student_text = f"{student_eq['equation']}. Description: {student_eq['description']}"
-            student_vec = embedding_model.embed_query(student_text)
-            sim_score = np.dot(master_vec, student_vec) # Use dot product for cosine similarity
+    if remaining and student_texts:
+        # One embedding batch for both sides, then (M x D) @ (D x S) similarity matrix
+        if master_vectors is not None:
+            master_matrix = np.asarray(master_vectors, dtype=np.float32)[remaining]
+            student_matrix = embed_texts(student_texts, embedding_model, cache)
+        else:
+            vectors = embed_texts([master_texts[i] for i in remaining] + student_texts, embedding_model, cache)
+            master_matrix = vectors[:len(remaining)]
+            student_matrix = vectors[len(remaining):]
+        similarity = master_matrix @ student_matrix.T  # Use dot product for cosine similarity
+        remaining_best = similarity.argmax(axis=1)
+        best_indices[remaining] = remaining_best
+        best_scores[remaining] = similarity[np.arange(len(remaining)), remaining_best]
 
-            if sim_score > best_sim_score:
-                best_sim_score = sim_score
-                best_student_eq = student_eq
+    stages["embedding"] = 0
+    stages["unmatched"] = 0
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    for i, (master_eq, best_index, best_score) in enumerate(zip(master_extractions, best_indices, best_scores)):
+        # Only positive similarities count as a candidate match
+        if best_score > 0:
+            best_sim_score = float(best_score)
+            best_student_eq = student_extractions[int(best_index)]
+        else:
+            best_sim_score = 0
+            best_student_eq = None
 
         if best_sim_score >= 0.90:
             matched_equations.add(master_eq['equation'])
-            print(f"\n✅ Best Match:")
-            print(f"  Master Equation   : {master_eq['equation']}")
-            print(f"  Student Equation  : {best_student_eq['equation']}")
-            print(f"  Similarity Score  : {best_sim_score:.4f}")
+            if i not in local_matches:
+                stages["embedding"] += 1
+            if debug:
+                logger.debug("Matched %s -> %s (%.4f)", master_eq['equation'], best_student_eq['equation'], best_sim_score)
         else:
-            print(f"\n❌ Not Matched:")
-            print(f"  Master Equation   : {master_eq['equation']}")
+            if debug:
+                logger.debug("Not matched: %s", master_eq['equation'])
+            stages["unmatched"] += 1
             feedback_matrix.append({
                 "equation": master_eq['equation'],
                 "description": master_eq['description'],
@@ -78,10 +136,12 @@ def score_equations(master_extractions, student_extractions, embedding_model):
             })
 
     final_equation_score = len(matched_equations) / total if total > 0 else 0
+    record_stages(stages)
 
     return {
         "score": len(matched_equations),
         "total_master_equations": total,
         "final_equation_score": final_equation_score,
-        "feedback_matrix": feedback_matrix
+        "feedback_matrix": feedback_matrix,
+        "match_stages": stages
     }
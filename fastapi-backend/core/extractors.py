@@ -1,29 +1,15 @@
 # extractors.py
 import re
-import json
+import asyncio
+import logging
+from functools import partial
 
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from core.llm import get_chain, invoke_parsed, ainvoke_parsed
+from core.parsing import parse_json_array, strip_fences, LLMOutputError
 
-# Converts LLM output (either a plain string or an AIMessage object) into a clean JSON-ready string.
-# Removes code block markers like ```json and backticks to safely parse the content.
-def run_chain(chain, input_data):
-    result = chain.invoke(input_data)
-    return getattr(result, "content", result)
+logger = logging.getLogger(__name__)
 
-def clean_llm_output(output) -> str:
-    if hasattr(output, "content"):
-        output = output.content
-    return output.strip().removeprefix("```json").removesuffix("```").strip("`").strip()
-
-
-def extract_equations(master_answer: str, student_answer: str, model_name: str = "gemini-1.5-flash"):
-    # Instantiate your LLM
-    llm = ChatGoogleGenerativeAI(model=model_name)
-
-    # Create a prompt template to extract equations and descriptions
-    prompt = ChatPromptTemplate.from_template(
-        """
+EXTRACTION_PROMPT = """
 Extract all mathematical equations from the following answer.
 For each equation, return a JSON object with:
   - \"equation\": the exact equation text
@@ -36,47 +22,80 @@ Do NOT include any markdown formatting, backticks, or extra text before or after
 Answer text:
 {input}
 """
-    )
 
-    # Build the extraction chain
-    extract_chain = prompt | llm
+# Structured-output schema: a JSON array of {equation, description} objects
+EXTRACTION_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "equation": {"type": "string"},
+            "description": {"type": "string"},
+        },
+        "required": ["equation", "description"],
+    },
+}
+
+def build_extract_chain(model_name: str = "gemini-1.5-flash"):
+    # Shared extraction chain (prompt | llm), built once per model
+    return get_chain("extract_equations", EXTRACTION_PROMPT, model_name, response_schema=EXTRACTION_SCHEMA)
+
+def parse_extraction_output(json_str: str, label: str, required: bool = False):
+    """
+    Parses cleaned extraction output into a list of equation dictionaries.
 
-    # Run extraction on master and student answers
-    master_json_str = run_chain(extract_chain,master_answer)
-    student_json_str = run_chain(extract_chain,student_answer)
-    
-    # Remove markdown/code block formatting
-    master_json_str = clean_llm_output(master_json_str)
-    student_json_str = clean_llm_output(student_json_str)
-
-    # Debug logs (optional)
-    print("Master JSON output:", master_json_str)
-    print("Student JSON output:", student_json_str)
-
-    try:
-        # Log raw output for debugging
-        print("\n🔍 Raw Gemini Outputs")
-        print("Master JSON Raw:", repr(master_json_str))
-        print("Student JSON Raw:", repr(student_json_str))
-
-        # Parse master answer
-        if not master_json_str.strip():
-            raise ValueError("LLM returned empty output for master answer.")
-        else:
-            master_extractions = json.loads(master_json_str, strict=False)
+    Args:
+        json_str: The cleaned LLM output.
+        label: "master" or "student", used in log and error messages.
+        required: If True, empty output is an error; otherwise it means no equations.
 
-        # Parse student answer (with fallback if empty)
-        if not student_json_str.strip():
-            print("⚠️ Student answer has no extractable equations. Using empty list.")
-            student_extractions = []
-        else:
-            student_extractions = json.loads(student_json_str, strict=False)
+    Returns:
+        The parsed list of extractions.
+    """
+    logger.debug("%s extraction raw output: %r", label.capitalize(), json_str)
+
+    if not json_str.strip():
+        if required:
+            raise LLMOutputError(f"LLM returned empty output for {label} answer.")
+        logger.info("%s answer has no extractable equations; using an empty list.", label.capitalize())
+        return []
 
-    except json.JSONDecodeError as json_err:
-        raise ValueError(f"❌ JSON parsing failed.\nRaw student output:\n{student_json_str}\n\nError: {json_err}")
-    except Exception as e:
-        raise ValueError(f"❌ Unexpected error during parsing: {e}")
+    # Tolerant parse: recovers the array from fenced, decorated or truncated output
+    extractions = parse_json_array(json_str)
+    return [eq for eq in extractions if isinstance(eq, dict) and "equation" in eq and "description" in eq]
 
+def _parse_extraction(content, label: str, required: bool):
+    # Fences come off first so a fenced empty reply still counts as empty
+    return parse_extraction_output(strip_fences(content), label, required)
+
+def extract_equations_from_text(answer: str, model_name: str = "gemini-1.5-flash", required: bool = False, label: str = "student"):
+    """
+    Extracts equations from a single answer with one LLM call, retrying
+    only this call if its output can't be parsed.
+    """
+    parse = partial(_parse_extraction, label=label, required=required)
+    return invoke_parsed(build_extract_chain(model_name), answer, parse, call="extract")
+
+async def aextract_equations_from_text(answer: str, model_name: str = "gemini-1.5-flash", required: bool = False, label: str = "student"):
+    """
+    Async variant of extract_equations_from_text (uses ainvoke under the shared LLM concurrency limit).
+    """
+    parse = partial(_parse_extraction, label=label, required=required)
+    return await ainvoke_parsed(build_extract_chain(model_name), answer, parse, call="extract")
+
+def extract_equations(master_answer: str, student_answer: str, model_name: str = "gemini-1.5-flash"):
+    # Run extraction on master and student answers
+    return {
+        "master_extractions": extract_equations_from_text(master_answer, model_name, required=True, label="master"),
+        "student_extractions": extract_equations_from_text(student_answer, model_name)
+    }
+
+async def aextract_equations(master_answer: str, student_answer: str, model_name: str = "gemini-1.5-flash"):
+    # Master and student extractions run concurrently
+    master_extractions, student_extractions = await asyncio.gather(
+        aextract_equations_from_text(master_answer, model_name, required=True, label="master"),
+        aextract_equations_from_text(student_answer, model_name),
+    )
     return {
         "master_extractions": master_extractions,
         "student_extractions": student_extractions
@@ -90,7 +109,7 @@ def normalize_equation(eq: str):
 def process_extractions(extractions, normalize_func):
     """
     Processes a list of equation extractions by normalizing equations and
-    adding a 'raw_equation' key.
+    adding a 'raw_equation' key. Running it again on the same list is a no-op.
 
     Args:
         extractions: A list of dictionaries, where each dictionary
@@ -108,7 +127,8 @@ def process_extractions(extractions, normalize_func):
     for eq in extractions:
         # Check if 'equation' key exists before accessing
         if 'equation' in eq:
-            eq['raw_equation'] = eq['equation']
-            eq['equation'] = normalize_func(eq['equation'])
+            # Idempotent: a second pass keeps the original text as raw_equation
+            eq.setdefault('raw_equation', eq['equation'])
+            eq['equation'] = normalize_func(eq['raw_equation'])
         else:
-            print(f"Warning: 'equation' key not found in extraction: {eq}")
\ No newline at end of file
+            logger.warning("'equation' key not found in extraction: %s", eq)
\ No newline at end of file
@@ -0,0 +1,309 @@
+# fakes.py
+"""
+Deterministic local stand-ins for Gemini, the Gemini embedding model,
+SBERT/E5 and Cosmos DB, used by OFFLINE_MODE and scripts/benchmark.py.
+
+OFFLINE_MODE=1 swaps the remote services (chat model, embeddings, Cosmos)
+for these fakes; FAKE_ENCODERS=1 also replaces the local SBERT/E5 models,
+for machines without the weights. Latency of the fake remote calls is set
+with FAKE_LLM_LATENCY_SECONDS and FAKE_EMBEDDING_LATENCY_SECONDS.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+OFFLINE_MODE = os.getenv("OFFLINE_MODE", "0") == "1"
+FAKE_ENCODERS = os.getenv("FAKE_ENCODERS", "0") == "1"
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0"))
+FAKE_EMBEDDING_LATENCY_SECONDS = float(os.getenv("FAKE_EMBEDDING_LATENCY_SECONDS", "0"))
+
+# Calls made to each fake, e.g. call_counts["llm_extract"]
+call_counts = Counter()
+_counts_lock = threading.Lock()
+
+# Compact equations such as "v1=a1*t1" or "E=m*c^2" (no spaces inside)
+_EQUATION_RE = re.compile(r"[A-Za-z0-9_^*/+\-().]+=[A-Za-z0-9_^*/+\-().]+")
+_FINAL_SCORE_RE = re.compile(r"Final Score \(use this directly\):\s*([0-9.]+)")
+_VERDICTS = [(9, "Outstanding"), (7.5, "Excellent"), (6, "Good"), (4, "Fair"), (2, "Not Good"), (0, "Bad")]
+
+
+def _count(name: str, amount: int = 1):
+    with _counts_lock:
+        call_counts[name] += amount
+
+
+def hash_vector(text: str, dim: int) -> np.ndarray:
+    """Unit vector seeded by the text, so equal texts always embed the same."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def _extraction_response(prompt: str) -> str:
+    answer = prompt.split("Answer text:", 1)[-1]
+    equations = [eq.rstrip(".") for eq in _EQUATION_RE.findall(answer)]
+    return json.dumps([
+        {"equation": eq, "description": "{} equals {}".format(*eq.split("=", 1))}
+        for eq in equations
+    ])
+
+
+def _feedback_response(prompt: str) -> str:
+    match = _FINAL_SCORE_RE.search(prompt)
+    score = float(match.group(1)) if match else 0.0
+    verdict = next(name for bound, name in _VERDICTS if score >= bound)
+    return json.dumps({
+        "score_out_of_10": score,
+        "verdict": verdict,
+        "comment": "The answer covers the main idea.",
+        "advice": "Review the equations you left out.",
+    })
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers the extraction and feedback prompts with canned
+    JSON built from the prompt itself, after latency_seconds.
+
+    Extraction returns every compact "lhs=rhs" equation found in the answer;
+    feedback echoes the final score from the prompt.
+    """
+
+    latency_seconds: float = FAKE_LLM_LATENCY_SECONDS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _respond(self, messages) -> ChatResult:
+        prompt = messages[-1].content
+        if "Answer text:" in prompt:
+            kind, content = "extract", _extraction_response(prompt)
+        else:
+            kind, content = "feedback", _feedback_response(prompt)
+        _count(f"llm_{kind}")
+        message = AIMessage(
+            content=content,
+            # Rough 4-characters-per-token estimate, so token accounting has something to count
+            usage_metadata={
+                "input_tokens": len(prompt) // 4,
+                "output_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # kwargs carries response_mime_type/response_schema when bound; the canned JSON already matches
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self._respond(messages)
+
+
+class FakeEmbeddings(Embeddings):
+    """Hash-seeded embeddings with a fixed latency per call."""
+
+    def __init__(self, dim: int = 768, latency_seconds: float = FAKE_EMBEDDING_LATENCY_SECONDS):
+        self.dim = dim
+        self.latency_seconds = latency_seconds
+
+    def embed_documents(self, texts):
+        _count("embedding_calls")
+        _count("embedding_texts", len(texts))
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return [hash_vector(text, self.dim).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeSentenceEncoder:
+    """Stand-in for SentenceTransformer.encode with hash-seeded vectors."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def encode(self, texts, batch_size: int = 32, convert_to_numpy: bool = True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        _count("sbert_texts", len(texts))
+        vectors = np.stack([hash_vector(text, self.dim) for text in texts]) if texts else np.zeros((0, self.dim), np.float32)
+        return vectors[0] if single else vectors
+
+
+class FakeTokenizer:
+    # Passes the raw texts through; FakeEncoderModel hashes them
+    def __call__(self, texts, **kwargs):
+        return {"texts": [texts] if isinstance(texts, str) else list(texts)}
+
+
+class FakeEncoderModel:
+    """Stand-in for the E5 transformer: one hash-seeded CLS vector per text."""
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def __call__(self, texts):
+        import torch
+
+        _count("e5_texts", len(texts))
+        hidden = np.stack([hash_vector(text, self.dim) for text in texts])[:, None, :]
+        return SimpleNamespace(last_hidden_state=torch.from_numpy(hidden))
+
+
+class _Pages(list):
+    # Mimics azure.core ItemPaged: iterable, with by_page()
+    def __init__(self, items, page_size):
+        super().__init__(items)
+        self.page_size = page_size or 100
+
+    def by_page(self):
+        return iter([self[i:i + self.page_size] for i in range(0, len(self), self.page_size)])
+
+
+_SELECT_RE = re.compile(
+    r"SELECT\s+(?:TOP\s+(\d+)\s+)?(.*?)\s+FROM\s+c\b(?:\s+WHERE\s+(.*))?$", re.IGNORECASE | re.DOTALL
+)
+_CONDITION_RE = re.compile(r"c\.(\w+)\s*=\s*(@\w+|'(?:[^']|'')*')")
+
+
+class InMemoryContainer:
+    """
+    Cosmos container stand-in holding items in a dict by id.
+
+    query_items understands the queries this service issues: SELECT [TOP n]
+    * or a c.field projection, with c.field = @param / 'literal' conditions
+    joined by AND. The aio attribute is an azure.cosmos.aio-style view of the
+    same items. query_count and read_count count round trips,
+    cross_partition_count the queries that were not scoped to a partition.
+
+    Like a real container it is partitioned by partition_key_path: read_item
+    only finds an item in its own partition, a partition_key restricts a
+    query to that partition, and the sync client refuses unscoped queries
+    unless enable_cross_partition_query is set.
+    """
+
+    def __init__(self, items=None, partition_key_path: str = "/questionId"):
+        self.items = {}
+        self.partition_key_path = partition_key_path
+        self.query_count = 0
+        self.read_count = 0
+        self.cross_partition_count = 0
+        self._lock = threading.Lock()
+        for item in items or []:
+            self.upsert_item(item)
+        self.aio = AsyncInMemoryContainer(self)
+
+    def upsert_item(self, body: dict):
+        item = dict(body)
+        # Student ids follow "{userId}-{questionId}", master ids are the questionId
+        item.setdefault("id", f"{item['userId']}-{item['questionId']}" if item.get("userId") else item.get("questionId"))
+        with self._lock:
+            self.items[item["id"]] = item
+        return item
+
+    def _partition_of(self, item: dict):
+        return item.get(self.partition_key_path.lstrip("/")) if self.partition_key_path else None
+
+    def read_item(self, item: str, partition_key=None):
+        with self._lock:
+            self.read_count += 1
+            found = self.items.get(item)
+        if found is not None and self._partition_of(found) != partition_key:
+            found = None
+        if found is None:
+            from azure.cosmos.exceptions import CosmosResourceNotFoundError
+            raise CosmosResourceNotFoundError(message=f"Item {item} not found")
+        return dict(found)
+
+    def query_items(self, query: str, parameters=None, enable_cross_partition_query=None, max_item_count=None,
+                    partition_key=None, **kwargs):
+        if partition_key is None and self.partition_key_path:
+            if not enable_cross_partition_query:
+                raise ValueError("Cross partition query is required but disabled.")
+            self.cross_partition_count += 1
+        self.query_count += 1
+        match = _SELECT_RE.match(query.strip())
+        if match is None:
+            raise ValueError(f"Unsupported query for InMemoryContainer: {query}")
+        top, projection, where = match.groups()
+        values = {p["name"]: p["value"] for p in parameters or []}
+
+        conditions = []
+        for field, raw in _CONDITION_RE.findall(where or ""):
+            value = values[raw] if raw.startswith("@") else raw[1:-1].replace("''", "'")
+            conditions.append((field, value))
+
+        fields = None if projection.strip() == "*" else [f.strip().removeprefix("c.") for f in projection.split(",")]
+        with self._lock:
+            rows = [
+                item if fields is None else {f: item.get(f) for f in fields}
+                for item in self.items.values()
+                if all(item.get(field) == value for field, value in conditions)
+                and (partition_key is None or self._partition_of(item) == partition_key)
+            ]
+        if top is not None:
+            rows = rows[:int(top)]
+        return _Pages([dict(row) for row in rows], max_item_count)
+
+
+class _AsyncList:
+    # One page of an async query: async-iterable like azure.cosmos.aio pages
+    def __init__(self, items):
+        self.items = items
+
+    async def __aiter__(self):
+        for item in self.items:
+            yield item
+
+
+class _AsyncPages:
+    def __init__(self, pages: _Pages):
+        self.pages = pages
+
+    async def __aiter__(self):
+        for item in self.pages:
+            yield item
+
+    async def by_page(self):
+        for page in self.pages.by_page():
+            yield _AsyncList(page)
+
+
+class AsyncInMemoryContainer:
+    """azure.cosmos.aio-style view of an InMemoryContainer (awaitable reads, async iteration)."""
+
+    def __init__(self, container: InMemoryContainer):
+        self.container = container
+
+    async def upsert_item(self, body: dict):
+        return self.container.upsert_item(body)
+
+    async def read_item(self, item: str, partition_key=None):
+        return self.container.read_item(item, partition_key)
+
+    def query_items(self, query: str, parameters=None, max_item_count=None, partition_key=None, **kwargs):
+        # The aio client fans out across partitions without being asked
+        return _AsyncPages(self.container.query_items(
+            query, parameters, enable_cross_partition_query=partition_key is None, max_item_count=max_item_count,
+            partition_key=partition_key, **kwargs
+        ))
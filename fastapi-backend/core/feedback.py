@@ -1,44 +1,14 @@
 # feedback.py
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
 import json
+import logging
 
-def run_chain(chain, input_data):
-    result = chain.invoke(input_data)
-    return getattr(result, "content", result)
+from core.llm import get_chain, invoke_parsed, ainvoke_parsed
+from core.parsing import parse_json_object
 
-def generate_semantic_feedback(
-    master_text,
-    student_text,
-    feedback_matrix,
-    final_equation_score,
-    sbert_score,
-    e5_score,
-    final_score,
-    model_name
-):
-    """
-    Generates semantic feedback for a student based on their answer and comparison metrics.
+logger = logging.getLogger(__name__)
 
-    Args:
-        master_text: The master answer text with equation descriptions.
-        student_text: The student answer text with equation descriptions.
-        feedback_matrix: The matrix containing feedback on unmatched equations.
-        final_equation_score: The final equation matching score.
-        sbert_score: The SBERT similarity score.
-        e5_score: The E5 similarity score.
-        final_score: The final calculated score out of 10.
-
-    Returns:
-        A dictionary containing the semantic feedback (score, verdict, comment, advice).
-    """
-    # 1. LLM instance
-    llm = ChatGoogleGenerativeAI(model= model_name)
-
-    # 2. Prompt Template
-    semantic_feedback_prompt = ChatPromptTemplate.from_template(
-        """
+SEMANTIC_FEEDBACK_PROMPT = """
 You are a helpful and constructive teacher. Based on the comparison below, generate feedback for a student in simple, encouraging language.
 
 Give your output as a JSON object with:
@@ -74,13 +44,26 @@ Final Score (use this directly): {final_score}
 
 Return ONLY the JSON object. No preamble, no markdown formatting, no backticks, and no extra explanation.
 """
-    )
-
-    # 3. Chain
-    semantic_chain = semantic_feedback_prompt | llm
 
+# Structured-output schema for the feedback object
+FEEDBACK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score_out_of_10": {"type": "number"},
+        "verdict": {"type": "string"},
+        "comment": {"type": "string"},
+        "advice": {"type": "string"},
+    },
+    "required": ["score_out_of_10", "verdict", "comment", "advice"],
+}
+
+def build_feedback_chain(model_name):
+    # 1-3. Shared LLM client, prompt template and chain, built once per model
+    return get_chain("semantic_feedback", SEMANTIC_FEEDBACK_PROMPT, model_name, response_schema=FEEDBACK_SCHEMA)
+
+def build_feedback_input(master_text, student_text, feedback_matrix, final_equation_score, sbert_score, e5_score, final_score):
     # 4. Inputs
-    chain_input = {
+    return {
         "master": master_text,
         "student": student_text,
         "unmatched_equations": json.dumps([eq["equation"] for eq in feedback_matrix]),
@@ -90,16 +73,70 @@ Return ONLY the JSON object. No preamble, no markdown formatting, no backticks,
         "final_score": final_score
     }
 
-    # 5. Run the chain and parse output
-    response_text = run_chain(semantic_chain,chain_input)
+def parse_feedback_output(response_text):
+    # 6. Parse (tolerating fences or surrounding text) and log the JSON response
+    response_json = parse_json_object(response_text)
+    logger.debug("Semantic feedback: %s", response_json)
+    return response_json
 
-    # 6. Pretty print the JSON response
+def _feedback_failed(error):
+    logger.warning("Failed to parse feedback response as JSON after retries: %s", error)
+    return None
+
+def generate_semantic_feedback(
+    master_text,
+    student_text,
+    feedback_matrix,
+    final_equation_score,
+    sbert_score,
+    e5_score,
+    final_score,
+    model_name
+):
+    """
+    Generates semantic feedback for a student based on their answer and comparison metrics.
+
+    Args:
+        master_text: The master answer text with equation descriptions.
+        student_text: The student answer text with equation descriptions.
+        feedback_matrix: The matrix containing feedback on unmatched equations.
+        final_equation_score: The final equation matching score.
+        sbert_score: The SBERT similarity score.
+        e5_score: The E5 similarity score.
+        final_score: The final calculated score out of 10.
+
+    Returns:
+        A dictionary containing the semantic feedback (score, verdict, comment, advice).
+    """
+    semantic_chain = build_feedback_chain(model_name)
+    chain_input = build_feedback_input(
+        master_text, student_text, feedback_matrix, final_equation_score, sbert_score, e5_score, final_score
+    )
+
+    # 5. Run the chain and parse output, retrying only this call on unparseable output
+    try:
+        return invoke_parsed(semantic_chain, chain_input, parse_feedback_output, call="feedback")
+    except ValueError as e:
+        return _feedback_failed(e)
+
+async def agenerate_semantic_feedback(
+    master_text,
+    student_text,
+    feedback_matrix,
+    final_equation_score,
+    sbert_score,
+    e5_score,
+    final_score,
+    model_name
+):
+    """
+    Async variant of generate_semantic_feedback (uses ainvoke under the shared LLM concurrency limit).
+    """
+    semantic_chain = build_feedback_chain(model_name)
+    chain_input = build_feedback_input(
+        master_text, student_text, feedback_matrix, final_equation_score, sbert_score, e5_score, final_score
+    )
     try:
-        response_json = json.loads(response_text)
-        print("\n✅ Final Semantic Feedback:\n")
-        print(json.dumps(response_json, indent=2))
-        return response_json
-    except Exception as e:
-        print("⚠️ Failed to parse LLM response as JSON.")
-        print("Raw response:\n", response_text)
-        return None
+        return await ainvoke_parsed(semantic_chain, chain_input, parse_feedback_output, call="feedback")
+    except ValueError as e:
+        return _feedback_failed(e)
@@ -0,0 +1,263 @@
+# inference.py
+"""
+Local inference worker for the SBERT/E5 encoders.
+
+One worker process owns the models; API workers (and scoring processes)
+send encode requests to it over a Unix socket instead of each loading
+their own copy. Requests that arrive within INFERENCE_MAX_WAIT_MS of each
+other are merged by a MicroBatcher into one padded forward pass of up to
+INFERENCE_MAX_BATCH texts.
+
+Wire format: every message is a 4-byte big-endian length followed by the
+payload. Requests are JSON ({"op": "encode", "model", "texts"} or
+{"op": "stats"}); a response is a JSON header, followed for encodes by one
+raw float32 frame of header["shape"].
+"""
+
+import asyncio
+import json
+import logging
+import os
+import resource
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Unset: every process loads SBERT/E5 itself. Set: encodes go to the worker listening here.
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET")
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "64"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_TIMEOUT_SECONDS", "60"))
+
+_LENGTH = struct.Struct(">I")
+
+
+class InferenceError(RuntimeError):
+    """Raised by InferenceClient when the worker reports an error."""
+
+
+def _frame(payload: bytes) -> bytes:
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Inference worker closed the connection.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_frame(sock) -> bytes:
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return _recv_exact(sock, size)
+
+
+async def _read_frame(reader) -> bytes:
+    (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(size)
+
+
+class MicroBatcher:
+    """
+    Collects encode requests for up to max_wait_ms (or until max_batch texts
+    are waiting) and runs them through encode as one call on a dedicated
+    thread. Duplicate texts within a batch are encoded once.
+    """
+
+    def __init__(self, name: str, encode, max_batch: int = INFERENCE_MAX_BATCH, max_wait_ms: float = INFERENCE_MAX_WAIT_MS):
+        self.name = name
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.stats = Counter()
+        self._queue = asyncio.Queue()
+        # One thread per model: forward passes of the same model never overlap
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"encode-{name}")
+
+    async def submit(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(texts), future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        count = len(batch[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while count < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            count += len(item[0])
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            unique = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+            self.stats.update(batches=1, requests=len(batch), texts=len(unique))
+            try:
+                vectors = np.asarray(await loop.run_in_executor(self._executor, self.encode, unique), dtype=np.float32)
+            except Exception as e:
+                logger.exception("%s batch of %d texts failed", self.name, len(unique))
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            rows = {text: i for i, text in enumerate(unique)}
+            for texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[[rows[text] for text in texts]])
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class InferenceServer:
+    """
+    Serves encode requests for the given encoders ({name: fn(texts) -> matrix})
+    on a Unix socket, batching each model's requests with a MicroBatcher.
+    """
+
+    def __init__(self, socket_path: str, encoders: dict, max_batch: int = INFERENCE_MAX_BATCH,
+                 max_wait_ms: float = INFERENCE_MAX_WAIT_MS):
+        self.socket_path = socket_path
+        self.batchers = {name: MicroBatcher(name, fn, max_batch, max_wait_ms) for name, fn in encoders.items()}
+        self.started_at = time.time()
+
+    async def _handle_request(self, request: dict):
+        if request.get("op") == "stats":
+            stats = {name: dict(batcher.stats) for name, batcher in self.batchers.items()}
+            return {
+                "models": list(self.batchers),
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                # ru_maxrss is in kilobytes on Linux
+                "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                "stats": stats,
+            }, None
+        batcher = self.batchers.get(request.get("model"))
+        if batcher is None:
+            return {"error": f"Unknown model: {request.get('model')}"}, None
+        texts = request.get("texts") or []
+        if not texts:
+            return {"shape": [0, 0]}, b""
+        vectors = await batcher.submit(texts)
+        return {"shape": list(vectors.shape)}, vectors.tobytes()
+
+    async def _serve_connection(self, reader, writer):
+        # Requests on one connection are answered in order
+        try:
+            while True:
+                try:
+                    request = json.loads(await _read_frame(reader))
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    header, body = await self._handle_request(request)
+                except Exception as e:
+                    header, body = {"error": str(e)}, None
+                writer.write(_frame(json.dumps(header).encode("utf-8")))
+                if body is not None:
+                    writer.write(_frame(body))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        runners = [asyncio.create_task(batcher.run()) for batcher in self.batchers.values()]
+        server = await asyncio.start_unix_server(self._serve_connection, path=self.socket_path)
+        logger.info("Inference worker serving %s on %s", ", ".join(self.batchers), self.socket_path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for runner in runners:
+                runner.cancel()
+            for batcher in self.batchers.values():
+                batcher.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+class InferenceClient:
+    """
+    Blocking client for the inference worker, safe to share between threads
+    (each thread keeps its own connection; the worker batches across them).
+    """
+
+    def __init__(self, socket_path: str = INFERENCE_SOCKET, timeout: float = INFERENCE_TIMEOUT_SECONDS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _drop_connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _request(self, request: dict):
+        payload = _frame(json.dumps(request).encode("utf-8"))
+        # One retry on a fresh connection covers a worker restart between requests
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                sock.sendall(payload)
+                header = json.loads(_recv_frame(sock))
+                body = _recv_frame(sock) if "shape" in header else None
+                break
+            except OSError:
+                self._drop_connection()
+                if attempt:
+                    raise
+        if "error" in header:
+            raise InferenceError(header["error"])
+        return header, body
+
+    def encode(self, model: str, texts) -> np.ndarray:
+        """Returns a float32 matrix with one embedding row per text."""
+        header, body = self._request({"op": "encode", "model": model, "texts": list(texts)})
+        return np.frombuffer(body, dtype=np.float32).reshape(header["shape"])
+
+    def stats(self):
+        return self._request({"op": "stats"})[0]
+
+    def status(self):
+        # Load-state entry for /ready, in the same shape as LazyModel.status()
+        try:
+            self.stats()
+        except (OSError, InferenceError) as e:
+            return {"state": "unreachable", "load_seconds": None, "error": str(e)}
+        return {"state": "ready", "load_seconds": None, "error": None}
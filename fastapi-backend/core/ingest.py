@@ -0,0 +1,137 @@
+# ingest.py
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+SNAPSHOT_NAME = "snapshot.ndjson"
+_SAFE_ID = re.compile(r"[A-Za-z0-9_-]{1,100}")
+
+
+class AnswerLog:
+    """
+    Append-only store of uploaded answers, one directory per question.
+
+    Every append writes its records to a new NDJSON segment (written to a
+    temporary file, fsynced and renamed into place), so concurrent uploads
+    never interleave or overwrite each other. Once a question has more than
+    compact_after segments they are folded into snapshot.ndjson, keeping the
+    latest answer per student, under an exclusive file lock that readers
+    share.
+
+    Records are {"type": "master" | "student", "userId", "answerText", "storedAt"}.
+    """
+
+    def __init__(self, base_dir: str, compact_after: int = 16):
+        self.base_dir = base_dir
+        self.compact_after = compact_after
+
+    def _question_dir(self, question_id: str) -> str:
+        # questionId comes from the client; anything that isn't a plain id is hashed
+        name = question_id if _SAFE_ID.fullmatch(question_id) else hashlib.sha256(question_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.base_dir, name)
+
+    @contextmanager
+    def _locked(self, directory: str, exclusive: bool):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _segments(self, directory: str):
+        # Segment names start with a nanosecond timestamp, so name order is write order
+        try:
+            return sorted(name for name in os.listdir(directory) if name.startswith("seg-") and name.endswith(".ndjson"))
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _write_atomic(path: str, records):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_records(path: str):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def append(self, question_id: str, master_answer: str = None, student_answers=()) -> int:
+        """
+        Stores a master answer and/or (student_id, answer_text) pairs as one
+        segment. Returns the number of records written.
+        """
+        now = time.time()
+        records = []
+        if master_answer is not None:
+            records.append({"type": "master", "answerText": master_answer, "storedAt": now})
+        records.extend(
+            {"type": "student", "userId": user_id, "answerText": answer_text, "storedAt": now}
+            for user_id, answer_text in student_answers
+        )
+        if not records:
+            return 0
+
+        directory = self._question_dir(question_id)
+        os.makedirs(directory, exist_ok=True)
+        name = f"seg-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.ndjson"
+        self._write_atomic(os.path.join(directory, name), records)
+
+        if len(self._segments(directory)) > self.compact_after:
+            self.compact(question_id)
+        return len(records)
+
+    def _merge(self, directory: str, segments):
+        master = None
+        students = {}
+        for name in [SNAPSHOT_NAME] + list(segments):
+            for record in self._read_records(os.path.join(directory, name)):
+                if record["type"] == "master":
+                    master = record
+                else:
+                    students[record["userId"]] = record
+        return master, students
+
+    def compact(self, question_id: str):
+        """Folds every current segment into the snapshot and deletes them."""
+        directory = self._question_dir(question_id)
+        with self._locked(directory, exclusive=True):
+            segments = self._segments(directory)
+            if not segments:
+                return
+            master, students = self._merge(directory, segments)
+            records = ([master] if master else []) + list(students.values())
+            self._write_atomic(os.path.join(directory, SNAPSHOT_NAME), records)
+            for name in segments:
+                os.remove(os.path.join(directory, name))
+
+    def read(self, question_id: str):
+        """
+        Returns {"master_answer": str or None, "students": {userId: answerText}}
+        with the latest stored answer per student.
+        """
+        directory = self._question_dir(question_id)
+        if not os.path.isdir(directory):
+            return {"master_answer": None, "students": {}}
+        with self._locked(directory, exclusive=False):
+            master, students = self._merge(directory, self._segments(directory))
+        return {
+            "master_answer": master["answerText"] if master else None,
+            "students": {user_id: record["answerText"] for user_id, record in students.items()},
+        }
@@ -0,0 +1,266 @@
+# jobs.py
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised by JobStore.submit when the number of pending jobs hits the limit."""
+
+
+class JobStore:
+    """
+    Persistent job queue in SQLite.
+
+    Jobs move pending -> running -> done | failed. A running job is leased
+    to the worker that claimed it until lease_until; the worker extends the
+    lease with heartbeat(). Once a lease expires (its worker crashed or was
+    killed) the job goes back to pending, or to failed after max_attempts,
+    so a job that keeps crashing its worker is not retried forever. Live
+    leases of other processes (uvicorn --workers, rolling restarts) are
+    never touched.
+    """
+
+    def __init__(self, path: str, max_pending: int = 100, lease_seconds: float = 60, max_attempts: int = 3):
+        self.path = path
+        self.max_pending = max_pending
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    lease_until REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, kind: str, params: dict) -> str:
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()[0]
+            if pending >= self.max_pending:
+                conn.execute("ROLLBACK")
+                raise JobQueueFull(f"Job queue is full ({pending} pending jobs).")
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'pending', ?)",
+                (job_id, kind, json.dumps(params), time.time()),
+            )
+            conn.execute("COMMIT")
+        return job_id
+
+    def claim_next(self, owner: str):
+        # Atomically recover expired leases, then move the oldest pending job to running under owner's lease
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire_leases(conn, now)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'pending' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1, owner = ?, lease_until = ? "
+                "WHERE id = ?",
+                (now, owner, now + self.lease_seconds, row["id"]),
+            )
+            conn.execute("COMMIT")
+        return {"id": row["id"], "kind": row["kind"], "params": json.loads(row["params"])}
+
+    def _expire_leases(self, conn, now: float):
+        failed = conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, owner = NULL, lease_until = NULL "
+            "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+            (f"Gave up after {self.max_attempts} attempts; the worker running it stopped responding.", now, now, self.max_attempts),
+        ).rowcount
+        requeued = conn.execute(
+            "UPDATE jobs SET status = 'pending', owner = NULL, lease_until = NULL "
+            "WHERE status = 'running' AND lease_until < ?",
+            (now,),
+        ).rowcount
+        if failed or requeued:
+            logger.warning("Recovered %d job(s) with expired leases (%d failed after max attempts).", failed + requeued, failed)
+
+    def heartbeat(self, owner: str) -> int:
+        # Extend the leases of every job owner is still running
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                (time.time() + self.lease_seconds, owner),
+            ).rowcount
+
+    def complete(self, job_id: str, result):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished_at = ?, owner = NULL, lease_until = NULL WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, owner = NULL, lease_until = NULL WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def release(self, owner: str) -> int:
+        # Graceful shutdown: hand owner's running jobs back without counting the interrupted attempt
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = MAX(attempts - 1, 0), owner = NULL, lease_until = NULL "
+                "WHERE status = 'running' AND owner = ?",
+                (owner,),
+            ).rowcount
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - older_than_seconds,),
+            ).rowcount
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "params": json.loads(row["params"]),
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+        }
+
+    def counts(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+class JobWorkerPool:
+    """
+    Runs queued jobs with a fixed number of asyncio workers.
+
+    handlers maps a job kind to an async function taking the job params and
+    returning a JSON-serializable result. Each pool owns its jobs' leases
+    under a unique owner id and renews them every lease_seconds / 3; the
+    same loop deletes finished jobs older than retention_seconds once per
+    purge_interval.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handlers: dict,
+        concurrency: int = 2,
+        poll_interval: float = 1.0,
+        retention_seconds: float = 7 * 24 * 3600,
+        purge_interval: float = 3600,
+    ):
+        self.store = store
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.purge_interval = purge_interval
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._workers = []
+        self._wakeup = None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._run_worker()) for _ in range(self.concurrency)]
+        self._workers.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        released = await asyncio.to_thread(self.store.release, self.owner)
+        if released:
+            logger.info("Released %d unfinished job(s) back to the queue.", released)
+
+    async def _maintain(self):
+        last_purge = 0.0
+        while True:
+            try:
+                await asyncio.to_thread(self.store.heartbeat, self.owner)
+                if time.monotonic() - last_purge >= self.purge_interval:
+                    purged = await asyncio.to_thread(self.store.purge_finished, self.retention_seconds)
+                    last_purge = time.monotonic()
+                    if purged:
+                        logger.info("Purged %d finished job(s).", purged)
+            except sqlite3.Error:
+                logger.exception("Job store maintenance failed.")
+            await asyncio.sleep(self.store.lease_seconds / 3)
+
+    def notify(self):
+        # Wake idle workers right away instead of waiting for the next poll
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run_worker(self):
+        while True:
+            job = await asyncio.to_thread(self.store.claim_next, self.owner)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            handler = self.handlers.get(job["kind"])
+            try:
+                if handler is None:
+                    raise ValueError(f"Unknown job kind: {job['kind']}")
+                result = await handler(job["params"])
+            except asyncio.CancelledError:
+                # Shutting down: stop() releases the job back to pending
+                raise
+            except Exception as e:
+                await asyncio.to_thread(self.store.fail, job["id"], str(e))
+            else:
+                await asyncio.to_thread(self.store.complete, job["id"], result)
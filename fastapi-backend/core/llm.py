@@ -0,0 +1,141 @@
+# llm.py
+
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from core import metrics
+from core.fakes import OFFLINE_MODE, FakeChatModel
+
+# Maximum number of Gemini calls in flight at once (per process)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+
+# HTTP connection pool for each Gemini client (kept alive between calls)
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+
+# Ask Gemini for schema-constrained JSON instead of relying on the prompt alone
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") == "1"
+# Retries of a single call whose output fails to parse, with capped exponential backoff
+LLM_PARSE_RETRIES = int(os.getenv("LLM_PARSE_RETRIES", "2"))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5"))
+LLM_RETRY_BACKOFF_MAX_SECONDS = 8.0
+
+_clients = {}
+_chains = {}
+_registry_lock = threading.Lock()
+
+
+def _http_client_args():
+    # Passed through to the httpx clients the Gemini SDK creates
+    limits = httpx.Limits(
+        max_connections=LLM_POOL_SIZE,
+        max_keepalive_connections=LLM_POOL_SIZE,
+        keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+    )
+    return {"limits": limits}
+
+
+def get_chat_model(model_name: str) -> ChatGoogleGenerativeAI:
+    """
+    Returns the process-wide chat client for model_name, creating it on first use.
+    """
+    with _registry_lock:
+        llm = _clients.get(model_name)
+        if llm is None:
+            if OFFLINE_MODE:
+                llm = FakeChatModel()
+            else:
+                llm = ChatGoogleGenerativeAI(model=model_name, client_args=_http_client_args())
+            _clients[model_name] = llm
+        return llm
+
+
+def get_chain(name: str, template: str, model_name: str, response_schema: dict = None):
+    """
+    Returns the prompt | llm chain registered under (name, model_name),
+    building it once and reusing it (and its client) on every later call.
+
+    With a response_schema (and LLM_STRUCTURED_OUTPUT on) the model is bound
+    to return JSON matching that schema.
+    """
+    key = (name, model_name)
+    chain = _chains.get(key)
+    if chain is None:
+        llm = get_chat_model(model_name)
+        if response_schema is not None and LLM_STRUCTURED_OUTPUT:
+            llm = llm.bind(response_mime_type="application/json", response_schema=response_schema)
+        with _registry_lock:
+            chain = _chains.get(key)
+            if chain is None:
+                chain = ChatPromptTemplate.from_template(template) | llm
+                _chains[key] = chain
+    return chain
+
+
+def _backoff_delay(attempt: int) -> float:
+    delay = min(LLM_RETRY_BACKOFF_SECONDS * (2 ** attempt), LLM_RETRY_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def invoke_parsed(chain, input_data, parse, call: str):
+    """
+    Invokes chain and returns parse(content). If parsing raises ValueError,
+    only this call is retried (up to LLM_PARSE_RETRIES times with backoff);
+    the last error is re-raised once retries run out.
+    """
+    for attempt in range(LLM_PARSE_RETRIES + 1):
+        metrics.llm_calls.labels(call=call).inc()
+        result = chain.invoke(input_data)
+        metrics.record_usage(result, call)
+        try:
+            return parse(getattr(result, "content", result))
+        except ValueError:
+            metrics.llm_parse_failures.labels(call=call).inc()
+            if attempt == LLM_PARSE_RETRIES:
+                metrics.llm_gave_up.labels(call=call).inc()
+                raise
+            metrics.llm_retries.labels(call=call).inc()
+            time.sleep(_backoff_delay(attempt))
+
+
+async def ainvoke_parsed(chain, input_data, parse, call: str):
+    """Async variant of invoke_parsed; each attempt holds an LLM concurrency slot."""
+    for attempt in range(LLM_PARSE_RETRIES + 1):
+        metrics.llm_calls.labels(call=call).inc()
+        result = await _ainvoke(chain, input_data)
+        metrics.record_usage(result, call)
+        try:
+            return parse(getattr(result, "content", result))
+        except ValueError:
+            metrics.llm_parse_failures.labels(call=call).inc()
+            if attempt == LLM_PARSE_RETRIES:
+                metrics.llm_gave_up.labels(call=call).inc()
+                raise
+            metrics.llm_retries.labels(call=call).inc()
+            await asyncio.sleep(_backoff_delay(attempt))
+
+
+_semaphore = None
+_semaphore_loop = None
+
+
+def llm_semaphore() -> asyncio.Semaphore:
+    # One semaphore per running event loop, created lazily inside that loop
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+        _semaphore_loop = loop
+    return _semaphore
+
+
+async def _ainvoke(chain, input_data):
+    async with llm_semaphore():
+        return await chain.ainvoke(input_data)
@@ -0,0 +1,132 @@
+# loader.py
+
+import contextlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModel:
+    """
+    Handle to a model that is loaded on first use (or ahead of time by a
+    background thread) instead of at import time.
+
+    Attribute access and calls are forwarded to the loaded object, so a
+    LazyModel can be passed anywhere the model itself was used.
+    """
+
+    def __init__(self, name: str, loader):
+        self.name = name
+        self._loader = loader
+        self._value = None
+        self._lock = threading.Lock()
+        self.state = "unloaded"
+        self.error = None
+        self.load_seconds = None
+
+    def get(self):
+        if self._value is not None:
+            return self._value
+        with self._lock:
+            if self._value is None:
+                self.state = "loading"
+                start = time.perf_counter()
+                try:
+                    self._value = self._loader()
+                except Exception as e:
+                    self.state = "failed"
+                    self.error = str(e)
+                    raise
+                self.load_seconds = round(time.perf_counter() - start, 3)
+                self.state = "ready"
+                self.error = None
+        return self._value
+
+    def set(self, value):
+        # Inject an already-built model (tests, benchmarks, offline mode)
+        with self._lock:
+            self._value = value
+            self.state = "ready"
+            self.error = None
+
+    @property
+    def ready(self) -> bool:
+        return self._value is not None
+
+    def status(self):
+        return {"state": self.state, "load_seconds": self.load_seconds, "error": self.error}
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+
+def load_in_background(models):
+    """
+    Loads the given LazyModels one after another in a daemon thread.
+    Failures are recorded on the handle and retried on first use.
+    """
+    def run():
+        for model in models:
+            try:
+                model.get()
+            except Exception as e:
+                logger.warning("Background load of %s failed: %s", model.name, e)
+
+    thread = threading.Thread(target=run, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+
+def _no_init_weights():
+    # Skip random initialization; every weight is replaced by the checkpoint anyway
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:
+        try:
+            from transformers.modeling_utils import no_init_weights
+        except ImportError:
+            return contextlib.nullcontext()
+    return no_init_weights()
+
+
+def load_mmap_model(model_name: str):
+    """
+    Loads a transformers model whose weights stay backed by the memory-mapped
+    safetensors file.
+
+    Pages are read on demand from the OS page cache, so several worker
+    processes loading the same checkpoint share one physical copy of the
+    weights instead of holding one each.
+    """
+    from safetensors import safe_open
+    from transformers import AutoConfig, AutoModel
+
+    if os.path.isdir(model_name):
+        weights_path = os.path.join(model_name, "model.safetensors")
+    else:
+        from huggingface_hub import hf_hub_download
+        weights_path = hf_hub_download(model_name, "model.safetensors")
+
+    config = AutoConfig.from_pretrained(model_name)
+    with _no_init_weights():
+        model = AutoModel.from_config(config)
+
+    prefix = f"{model.base_model_prefix}."
+    state_dict = {}
+    with safe_open(weights_path, framework="pt") as f:
+        for key in f.keys():
+            state_dict[key.removeprefix(prefix)] = f.get_tensor(key)
+
+    # assign=True keeps the mmap-backed tensors instead of copying into fresh parameters
+    missing, _ = model.load_state_dict(state_dict, strict=False, assign=True)
+    if any(not name.endswith("position_ids") for name in missing):
+        raise ValueError(f"Checkpoint {weights_path} is missing weights: {missing}")
+
+    model.eval()
+    return model
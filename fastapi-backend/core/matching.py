@@ -0,0 +1,188 @@
+# matching.py
+
+import os
+import re
+import string
+import time
+from functools import lru_cache
+from itertools import permutations
+from math import comb
+
+from core.extractors import normalize_equation
+from core.metrics import equation_match_stages
+
+try:
+    import sympy
+    from sympy.parsing.sympy_parser import (
+        parse_expr,
+        standard_transformations,
+        convert_xor,
+        split_symbols,
+        implicit_multiplication_application,
+    )
+except ImportError:  # SymPy is optional; without it only exact matching runs locally
+    sympy = None
+
+# Check symbolic equivalence (commutativity, rearranged or scaled sides) with SymPy
+SYMBOLIC_MATCHING = os.getenv("SYMBOLIC_MATCHING", "1") == "1"
+# Also accept equations that are equivalent up to renaming variables. Off by default:
+# any two relations of the same shape (F=ma, v=at) are "equivalent" under renaming.
+EQUATION_MATCH_RENAMING = os.getenv("EQUATION_MATCH_RENAMING", "0") == "1"
+MAX_RENAME_SYMBOLS = 4
+
+_ALLOWED_CHARS = set(string.ascii_letters + string.digits + "+-*/^().=")
+_MAX_EQUATION_LENGTH = 120
+_MAX_NUMERIC_EXPONENT = 6
+_MAX_SYMBOLS = 8
+# Upper bound on the terms sympy.expand may produce; (a+b+c+d)^40 would be 12341
+_MAX_EXPANDED_TERMS = 200
+_ALLOWED_FUNCTIONS = {"sin", "cos", "tan", "log", "exp"}
+# Wall-clock budget for the symbolic stage of one student; unresolved equations go to the embedding stage
+SYMBOLIC_BUDGET_SECONDS = float(os.getenv("SYMBOLIC_BUDGET_SECONDS", "0.5"))
+
+
+def record_stages(counts: dict):
+    for stage, count in counts.items():
+        if count:
+            equation_match_stages.labels(stage=stage).inc(count)
+
+
+def _is_safe(expr) -> bool:
+    # Reject power towers, huge literals and unexpected functions before anything is evaluated
+    for node in sympy.preorder_traversal(expr):
+        if isinstance(node, sympy.Function) and node.func.__name__ not in _ALLOWED_FUNCTIONS:
+            return False
+        if node.is_Integer and abs(int(node)) > 10 ** 6:
+            return False
+        if node.is_Pow:
+            exponent = node.args[1]
+            if exponent.is_Number:
+                if abs(exponent) > _MAX_NUMERIC_EXPONENT:
+                    return False
+            elif not exponent.free_symbols:
+                return False
+    return True
+
+
+def _expanded_terms(expr) -> int:
+    """Upper bound on the number of terms in sympy.expand(expr), computed without expanding."""
+    if expr.is_Add:
+        return sum(_expanded_terms(arg) for arg in expr.args)
+    if expr.is_Mul:
+        terms = 1
+        for arg in expr.args:
+            terms *= _expanded_terms(arg)
+        return terms
+    if expr.is_Pow and expr.args[1].is_Integer and expr.args[1] > 0:
+        # Multinomial: k terms to the n-th power give at most C(n+k-1, k-1) terms
+        base_terms, exponent = _expanded_terms(expr.args[0]), int(expr.args[1])
+        return comb(exponent + base_terms - 1, base_terms - 1)
+    return 1
+
+
+@lru_cache(maxsize=4096)
+def parse_equation(equation: str):
+    """
+    Parses "lhs=rhs" into the SymPy expression lhs - rhs, or None if the
+    equation can't be parsed safely. Only a plain arithmetic character set
+    is accepted, since parse_expr evaluates its input.
+    """
+    if sympy is None:
+        return None
+    eq = normalize_equation(equation)
+    if (
+        eq.count("=") != 1
+        or len(eq) > _MAX_EQUATION_LENGTH
+        or "__" in eq
+        or not set(eq) <= _ALLOWED_CHARS
+        or re.search(r"(?<!\d)\.|\.(?!\d)", eq)  # dots only inside decimal numbers
+    ):
+        return None
+
+    # Every letter is a plain symbol (so E, I, S, N are not SymPy constants)
+    local_dict = {c: sympy.Symbol(c) for c in string.ascii_letters}
+    transformations = standard_transformations + (convert_xor, split_symbols, implicit_multiplication_application)
+    lhs, rhs = eq.split("=")
+    try:
+        sides = [parse_expr(side, local_dict=local_dict, transformations=transformations, evaluate=False) for side in (lhs, rhs)]
+        if not all(_is_safe(side) for side in sides):
+            return None
+        difference = sides[0] - sides[1]
+        if len(difference.free_symbols) > _MAX_SYMBOLS or _expanded_terms(difference) > _MAX_EXPANDED_TERMS:
+            return None
+        return sympy.expand(difference)
+    except Exception:
+        return None
+
+
+def _equivalent(a, b) -> bool:
+    # Same relation if the differences agree up to sign or a constant factor
+    if sympy.expand(a - b) == 0 or sympy.expand(a + b) == 0:
+        return True
+    if b == 0:
+        return False
+    ratio = sympy.cancel(a / b)
+    return bool(ratio.is_number and ratio != 0)
+
+
+def symbolically_equivalent(master_eq: str, student_eq: str, renaming: bool = EQUATION_MATCH_RENAMING) -> bool:
+    a = parse_equation(master_eq)
+    b = parse_equation(student_eq)
+    if a is None or b is None:
+        return False
+    try:
+        if _equivalent(a, b):
+            return True
+        if not renaming:
+            return False
+        master_symbols = sorted(a.free_symbols, key=str)
+        student_symbols = sorted(b.free_symbols, key=str)
+        if len(master_symbols) != len(student_symbols) or len(master_symbols) > MAX_RENAME_SYMBOLS:
+            return False
+        for target in permutations(master_symbols):
+            renamed = b.xreplace(dict(zip(student_symbols, target)))
+            if _equivalent(a, renamed):
+                return True
+    except Exception:
+        return False
+    return False
+
+
+def prematch_equations(master_extractions, student_extractions, symbolic: bool = SYMBOLIC_MATCHING):
+    """
+    Resolves master equations locally before any embeddings are computed.
+
+    Exact matches are found by hashing normalized equations; the remaining
+    ones are optionally checked for symbolic equivalence, until
+    SYMBOLIC_BUDGET_SECONDS runs out.
+
+    Returns:
+        A tuple (matches, counts): matches maps master index to
+        (student index, stage), counts holds how many masters each stage resolved.
+    """
+    student_index_by_key = {}
+    for j, eq in enumerate(student_extractions):
+        student_index_by_key.setdefault(normalize_equation(eq['equation']), j)
+
+    matches = {}
+    counts = {"exact": 0, "symbolic": 0}
+    for i, eq in enumerate(master_extractions):
+        j = student_index_by_key.get(normalize_equation(eq['equation']))
+        if j is not None:
+            matches[i] = (j, "exact")
+            counts["exact"] += 1
+
+    if symbolic and sympy is not None:
+        deadline = time.monotonic() + SYMBOLIC_BUDGET_SECONDS
+        for i, master_eq in enumerate(master_extractions):
+            if i in matches:
+                continue
+            for j, student_eq in enumerate(student_extractions):
+                if time.monotonic() > deadline:
+                    return matches, counts
+                if symbolically_equivalent(master_eq['equation'], student_eq['equation']):
+                    matches[i] = (j, "symbolic")
+                    counts["symbolic"] += 1
+                    break
+
+    return matches, counts
@@ -0,0 +1,216 @@
+# metrics.py
+"""
+Prometheus metrics, collected with prometheus_client.
+
+With PROMETHEUS_MULTIPROC_DIR set, every process (uvicorn workers,
+SCORING_PROCESSES children) writes its samples to files in that directory
+and /metrics aggregates all of them, so a scrape sees the whole server,
+not whichever worker answered. The directory must be emptied before the
+server starts (the Docker image does this). Without it, metrics are kept
+in the process, which is what the offline scripts use.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if METRICS_DIR:
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+
+class CacheMetrics:
+    """
+    Exports the lookup counters and size of caches that keep their own
+    stats() (hits / disk_hits / misses or builds / entries). sync() adds
+    what changed since the previous call to the shared counters; it runs
+    after every timed() stage, every few seconds in each API worker
+    (sync_caches_periodically) and before each scrape.
+    """
+
+    def __init__(self):
+        self._caches = {}
+        self._reported = {}
+        self._lock = threading.Lock()
+        self.lookups = Counter("tutor_cache_lookups_total", "Cache lookups by result.", ("cache", "result"))
+        self.entries = Gauge(
+            "tutor_cache_entries", "Entries currently held in memory.", ("cache",), multiprocess_mode="livesum"
+        )
+
+    def add(self, name: str, stats):
+        # stats: zero-argument function returning the cache's stats() dict
+        self._caches[name] = stats
+
+    def sync(self):
+        with self._lock:
+            for name, stats in self._caches.items():
+                current = stats()
+                counts = {
+                    "hit": current.get("hits", 0),
+                    "disk_hit": current.get("disk_hits", 0),
+                    "miss": current.get("misses", current.get("builds", 0)),
+                }
+                for result, count in counts.items():
+                    delta = count - self._reported.get((name, result), 0)
+                    if delta > 0:
+                        self.lookups.labels(cache=name, result=result).inc(delta)
+                        self._reported[(name, result)] = count
+                if "entries" in current:
+                    self.entries.labels(cache=name).set(current["entries"])
+
+
+async def sync_caches_periodically(interval: float = 5.0):
+    # Lookups that happen outside timed() stages (e.g. result cache hits) reach /metrics within interval
+    while True:
+        caches.sync()
+        await asyncio.sleep(interval)
+
+
+def render() -> bytes:
+    """The /metrics response body, aggregated across processes when PROMETHEUS_MULTIPROC_DIR is set."""
+    caches.sync()
+    if not METRICS_DIR:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead():
+    # Drops this process's live gauges from the aggregate on shutdown
+    if METRICS_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def sample_value(name: str, **labels) -> float:
+    """Current value of one sample in this process (for benchmark reports), 0 if never recorded."""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def histogram_totals(histogram):
+    """{label values: (count, sum)} of a histogram in this process, e.g. for benchmark reports."""
+    totals = {}
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            key = tuple(value for label, value in sorted(sample.labels.items()) if label != "le")
+            count, total = totals.get(key, (0, 0.0))
+            if sample.name.endswith("_count"):
+                totals[key] = (int(sample.value), total)
+            elif sample.name.endswith("_sum"):
+                totals[key] = (count, sample.value)
+    return totals
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Grading pipeline stages
+stage_seconds = Histogram(
+    "tutor_stage_seconds", "Time spent in each grading stage.", ("stage",), buckets=LATENCY_BUCKETS
+)
+
+# LLM token usage, from the response usage metadata
+llm_tokens = Counter(
+    "tutor_llm_tokens_total", "LLM tokens used, by call and token type.", ("call", "type")
+)
+
+# Embedding, master profile and result caches (registered by core.model)
+caches = CacheMetrics()
+
+
+class RequestTimings:
+    """Per-request stage totals, rendered as a Server-Timing header."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}  # stage -> [count, seconds]
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def header(self) -> str:
+        # Stages that ran concurrently (per-student extraction, feedback) are summed
+        with self._lock:
+            items = sorted(self.stages.items())
+        parts = [f'{stage};dur={seconds * 1000:.1f};desc="{count}x"' for stage, (count, seconds) in items]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def track_request():
+    """Collects every timed() stage run in this context (and tasks/threads started from it)."""
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+@contextmanager
+def timed(stage: str):
+    """Records the wall-clock time of the block under tutor_stage_seconds{stage}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.labels(stage=stage).observe(elapsed)
+        caches.sync()
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+def record_usage(result, call: str):
+    # usage_metadata is set by LangChain chat models that report token counts
+    usage = getattr(result, "usage_metadata", None) or {}
+    if usage.get("input_tokens"):
+        llm_tokens.labels(call=call, type="input").inc(usage["input_tokens"])
+    if usage.get("output_tokens"):
+        llm_tokens.labels(call=call, type="output").inc(usage["output_tokens"])
+
+# LLM output handling
+llm_calls = Counter(
+    "tutor_llm_calls_total", "LLM calls made, including retries.", ("call",)
+)
+llm_parse_failures = Counter(
+    "tutor_llm_parse_failures_total", "LLM responses that could not be parsed as the expected JSON.", ("call",)
+)
+llm_retries = Counter(
+    "tutor_llm_retries_total", "LLM calls retried after a parse failure.", ("call",)
+)
+llm_gave_up = Counter(
+    "tutor_llm_gave_up_total", "LLM calls that still failed to parse after all retries.", ("call",)
+)
+
+# Scoring policy: scorers skipped by early stopping, feedback written by template instead of the LLM
+scorers_skipped = Counter(
+    "tutor_scorers_skipped_total", "Scorer runs skipped by the scoring policy.", ("scorer", "reason")
+)
+feedback_generated = Counter(
+    "tutor_feedback_total", "Student feedback produced, by kind (llm or template).", ("kind",)
+)
+
+# LLM calls saved by reusing a near-duplicate answer's extraction or feedback
+near_duplicate_reuse = Counter(
+    "tutor_near_duplicate_reuse_total", "Near-duplicate answers that reused another answer's LLM output.", ("stage",)
+)
+
+# Master equations resolved by each matching stage (exact, symbolic, embedding) or left unmatched
+equation_match_stages = Counter(
+    "tutor_equation_match_stages_total", "Master equations resolved per matching stage.", ("stage",)
+)
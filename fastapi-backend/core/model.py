@@ -5,69 +5,617 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 # External dependencies
+import asyncio
+import copy
 import json
+import multiprocessing
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 # LLM
-from langchain_google_genai import ChatGoogleGenerativeAI
+from core.llm import get_chat_model
 
-# Torch and Transformers
-import torch
-import torch.nn.functional as F
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModel
-
-# Langchain document/vector tools
-from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+# Model handles (heavy libraries are imported by the loaders, on first use)
+from core.loader import LazyModel, load_in_background, load_mmap_model
+from core.encoders import ENCODER_BACKEND, load_sbert, load_e5
+from core.inference import INFERENCE_SOCKET, InferenceClient
+from core.fakes import (
+    OFFLINE_MODE,
+    FAKE_ENCODERS,
+    FakeEmbeddings,
+    FakeSentenceEncoder,
+    FakeTokenizer,
+    FakeEncoderModel,
+)
+from core import metrics
+from core.cosmos import (
+    COSMOS_PAGE_SIZE,
+    read_master_answer,
+    read_student_answer,
+    iter_class_answers,
+    aread_master_answer,
+    aread_student_answer,
+    aiter_class_answers,
+)
 
 # Your internal modules
 # from storage import get_master_answer, get_student_answers
-from core.extractors import extract_equations, process_extractions, normalize_equation
-from core.evaluators import score_equations
+from core.extractors import (
+    extract_equations_from_text,
+    aextract_equations_from_text,
+    process_extractions,
+    normalize_equation,
+)
+from core.evaluators import score_equations, embed_texts, equation_text
 from core.scorers import (
-    calculate_sbert_similarity,
-    calculate_e5_similarity,
-    calculate_final_score,
+    encode_sbert,
+    encode_e5,
+    batch_cosine_scores,
+    configure_torch_threads,
+    SCORING_VERSION,
 )
 from core.utils import replace_equations_with_descriptions
-from core.feedback import generate_semantic_feedback
+from core.cache import EmbeddingCache
+from core.profiles import MasterProfile, MasterProfileCache, MasterProfileStore, PROFILE_VERSION
+from core.result_cache import ResultCache
+from core.feedback import generate_semantic_feedback, agenerate_semantic_feedback
+from core.policy import load_policy, template_feedback
+from core.duplicates import (
+    NEAR_DUPLICATE_REUSE,
+    NEAR_DUPLICATE_THRESHOLD,
+    NEAR_DUPLICATE_MAX_SCORE_DELTA,
+    cluster_near_duplicates,
+    duplicate_clusters,
+    math_signature,
+)
 
 # Load Gemini model
 model_name = "gemini-1.5-flash"
-# Load embedding model globally (or inject it externally)
-embedding_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
-# SBERT model
-sbert_model = SentenceTransformer('all-MiniLM-L6-v2')
+EMBEDDING_MODEL_NAME = "models/embedding-001"
+SBERT_MODEL_NAME = "all-MiniLM-L6-v2"
+E5_MODEL_NAME = "intfloat/e5-large-v2"
+
+# "background": load after startup in a thread, "lazy": load on first use, "eager": load at import
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background")
+# Keep E5 weights memory-mapped from safetensors so worker processes share them
+# (only with ENCODER_BACKEND=torch; int8 and onnx build their own copy of the weights)
+MODEL_MMAP_WEIGHTS = os.getenv("MODEL_MMAP_WEIGHTS", "0") == "1"
+
+# CPU intra-op threads for SBERT/E5 (TORCH_NUM_THREADS)
+configure_torch_threads()
+
+
+def _load_embedding_model():
+    if OFFLINE_MODE:
+        return FakeEmbeddings()
+    from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL_NAME)
+
+def _load_sbert_model():
+    if FAKE_ENCODERS:
+        return FakeSentenceEncoder()
+    return load_sbert(SBERT_MODEL_NAME, ENCODER_BACKEND)
+
+def _load_e5_tokenizer():
+    if FAKE_ENCODERS:
+        return FakeTokenizer()
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(E5_MODEL_NAME)
+
+def _load_e5_torch_model():
+    if MODEL_MMAP_WEIGHTS:
+        return load_mmap_model(E5_MODEL_NAME)
+    from transformers import AutoModel
+    return AutoModel.from_pretrained(E5_MODEL_NAME)
+
+def _load_e5_model():
+    if FAKE_ENCODERS:
+        return FakeEncoderModel()
+    # fp32 torch, int8-quantized torch or ONNX Runtime, per ENCODER_BACKEND
+    return load_e5(E5_MODEL_NAME, _load_e5_torch_model, backend=ENCODER_BACKEND)
+
+
+# Model handles, loaded on first use or by start_model_loading()
+embedding_model = LazyModel("embedding", _load_embedding_model)
+llm = LazyModel("llm", lambda: get_chat_model(model_name))
+sbert_model = LazyModel("sbert", _load_sbert_model)
+e5_tokenizer = LazyModel("e5_tokenizer", _load_e5_tokenizer)
+e5_model = LazyModel("e5", _load_e5_model)
+
+# With INFERENCE_SOCKET set, SBERT/E5 live in the inference worker (scripts/inference_worker.py)
+inference_client = InferenceClient(INFERENCE_SOCKET) if INFERENCE_SOCKET else None
+ENCODER_MODELS = [sbert_model, e5_tokenizer, e5_model]
+MODELS = [embedding_model, llm] + ([] if inference_client is not None else ENCODER_MODELS)
+
+
+def start_model_loading():
+    """Starts loading every model according to MODEL_LOAD_MODE; call once at app startup."""
+    if MODEL_LOAD_MODE == "background":
+        return load_in_background(MODELS)
+    return None
+
+
+def model_status():
+    # Per-model load state for the /ready endpoint
+    status = {model.name: model.status() for model in MODELS}
+    if inference_client is not None:
+        status["inference_worker"] = inference_client.status()
+    return status
+
+
+def models_ready() -> bool:
+    if inference_client is not None and inference_client.status()["state"] != "ready":
+        return False
+    return all(model.ready for model in MODELS)
+
+
+# Executor for the SBERT/E5 scoring stage; None means asyncio's default thread pool
+_scoring_executor = None
 
-# E5 model and tokenizer (initialized once globally)
-e5_tokenizer = AutoTokenizer.from_pretrained("intfloat/e5-large-v2")
-e5_model = AutoModel.from_pretrained("intfloat/e5-large-v2")
+
+def configure_scoring_executor(processes: int = None):
+    """
+    Moves torch scoring into a process pool of SCORING_PROCESSES workers
+    (0 keeps it on threads). Each worker process loads its own SBERT/E5 on
+    first use; combine with MODEL_MMAP_WEIGHTS=1 to share E5 weights.
+    """
+    global _scoring_executor
+    if processes is None:
+        processes = int(os.getenv("SCORING_PROCESSES", "0"))
+    if processes > 0 and _scoring_executor is None:
+        # spawn, not fork: forking a process that already started torch threads can deadlock
+        _scoring_executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    return _scoring_executor
+
+
+def shutdown_scoring_executor():
+    global _scoring_executor
+    if _scoring_executor is not None:
+        _scoring_executor.shutdown(wait=False, cancel_futures=True)
+        _scoring_executor = None
+
+
+async def run_scoring(fn, *args):
+    if _scoring_executor is None:
+        # to_thread copies the context, so the timed() stages inside fn reach Server-Timing
+        return await asyncio.to_thread(fn, *args)
+    # A worker process records its stages in its own registry; time the whole call here
+    with metrics.timed(fn.__name__):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_scoring_executor, fn, *args)
+
+
+if MODEL_LOAD_MODE == "eager":
+    for _model in MODELS:
+        _model.get()
+
+# Shared embedding cache (in-memory LRU, plus an on-disk tier if EMBEDDING_CACHE_DIR is set)
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+    disk_dir=os.getenv("EMBEDDING_CACHE_DIR"),
+)
+equation_embedding_cache = embedding_cache.scope(EMBEDDING_MODEL_NAME)
+# Quantized/ONNX vectors differ slightly from fp32 ones, so each backend gets its own cache entries
+_backend_suffix = "" if ENCODER_BACKEND == "torch" else f"@{ENCODER_BACKEND}"
+sbert_cache = embedding_cache.scope(SBERT_MODEL_NAME + _backend_suffix)
+e5_cache = embedding_cache.scope(E5_MODEL_NAME + _backend_suffix)
+
+# Score fusion, early stopping and template feedback (SCORING_POLICY_PATH, see core/policy.py)
+scoring_policy = load_policy()
+
+# Master profiles (per questionId, rebuilt when the master text changes), persisted under
+# MASTER_PROFILE_DIR so they are built once per master text (set it to "" to keep them in memory only)
+MASTER_PROFILE_DIR = os.getenv("MASTER_PROFILE_DIR", "storage/profiles")
+# Everything that changes a profile's extractions or vectors
+_profile_config = "|".join([
+    model_name,
+    EMBEDDING_MODEL_NAME,
+    SBERT_MODEL_NAME + _backend_suffix,
+    E5_MODEL_NAME + _backend_suffix,
+    "offline" if OFFLINE_MODE else "",
+    "fake-encoders" if FAKE_ENCODERS else "",
+])
+master_profiles = MasterProfileCache(
+    max_entries=int(os.getenv("MASTER_PROFILE_CACHE_SIZE", "1024")),
+    store=MasterProfileStore(MASTER_PROFILE_DIR, _profile_config) if MASTER_PROFILE_DIR else None,
+)
+
+# Persistent per-student result cache for /analyze (set RESULT_CACHE_ENABLED=0 to turn off)
+result_cache = ResultCache(
+    os.getenv("RESULT_CACHE_PATH", "storage/results.db"),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400")),
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000")),
+) if os.getenv("RESULT_CACHE_ENABLED", "1") == "1" else None
+
+# Cache hit rates on /metrics
+metrics.caches.add("embedding", embedding_cache.stats)
+metrics.caches.add("master_profile", master_profiles.stats)
+if result_cache is not None:
+    metrics.caches.add("result", result_cache.stats)
+
+def sbert_vectors(texts):
+    # Cached SBERT embeddings, from the inference worker when one is configured
+    if inference_client is not None:
+        return sbert_cache.get_many(texts, lambda batch: inference_client.encode("sbert", batch))
+    return encode_sbert(texts, sbert_model, sbert_cache)
+
+def e5_vectors(texts):
+    if inference_client is not None:
+        return e5_cache.get_many(texts, lambda batch: inference_client.encode("e5", batch))
+    return encode_e5(texts, e5_tokenizer, e5_model, e5_cache)
 
 def fetch_answers_from_cosmos(question_id: str, user_id: str, master_container, student_container):
-    # Fetch master answer (by question_id)
-    master_query = f"SELECT * FROM c WHERE c.questionId = '{question_id}'"
-    master_items = list(master_container.query_items(query=master_query, enable_cross_partition_query=True))
-    if not master_items:
+    # Master answer by questionId, then the student's answer by point read
+    master_answer = read_master_answer(master_container, question_id)
+    if master_answer is None:
         return {"error": "❌ Master answer not found."}
-    master_answer = master_items[0]["answerText"]
 
-    # Fetch student answers (by question_id and user_id)
-    student_query = (
-        f"SELECT * FROM c WHERE c.questionId = '{question_id}' AND c.userId = '{user_id}'"
+    student_answer = read_student_answer(student_container, question_id, user_id)
+    if student_answer is None:
+        return {"error": "❌ No student answers found for this user and question."}
+
+    return {
+        "master_answer": master_answer,
+        "student_answers": [student_answer]  # a list of {"userId", "answerText"}
+    }
+
+
+async def afetch_answers_from_cosmos(question_id: str, user_id: str, master_container, student_container):
+    """
+    Async variant of fetch_answers_from_cosmos for azure.cosmos.aio containers;
+    the master and student reads run concurrently.
+    """
+    master_answer, student_answer = await asyncio.gather(
+        aread_master_answer(master_container, question_id),
+        aread_student_answer(student_container, question_id, user_id),
     )
-    student_items = list(student_container.query_items(query=student_query, enable_cross_partition_query=True))
-    if not student_items:
+    if master_answer is None:
+        return {"error": "❌ Master answer not found."}
+    if student_answer is None:
         return {"error": "❌ No student answers found for this user and question."}
 
     return {
         "master_answer": master_answer,
-        "student_answers": student_items  # a list of dictionaries
+        "student_answers": [student_answer]
+    }
+
+
+def fetch_question_answers_from_cosmos(question_id: str, master_container, student_container, page_size: int = COSMOS_PAGE_SIZE):
+    """
+    Fetches the master answer and every student answer for a question, reading
+    the student container page by page with a single query.
+    """
+    master_answer = read_master_answer(master_container, question_id)
+    if master_answer is None:
+        return {"error": "❌ Master answer not found."}
+
+    student_items = []
+    for page in iter_class_answers(student_container, question_id, page_size):
+        student_items.extend(page)
+    if not student_items:
+        return {"error": "❌ No student answers found for this question."}
+
+    return {
+        "master_answer": master_answer,
+        "student_answers": student_items
+    }
+
+
+async def afetch_question_answers_from_cosmos(question_id: str, master_container, student_container, page_size: int = COSMOS_PAGE_SIZE):
+    # Async variant of fetch_question_answers_from_cosmos for azure.cosmos.aio containers
+    master_answer = await aread_master_answer(master_container, question_id)
+    if master_answer is None:
+        return {"error": "❌ Master answer not found."}
+
+    student_items = []
+    async for page in aiter_class_answers(student_container, question_id, page_size):
+        student_items.extend(page)
+    if not student_items:
+        return {"error": "❌ No student answers found for this question."}
+
+    return {
+        "master_answer": master_answer,
+        "student_answers": student_items
     }
 
 
-def analyze_question_from_db(question_id: str, user_id: str, master_container, student_container):
-    data = fetch_answers_from_cosmos(question_id, user_id, master_container, student_container)
+def build_master_profile(question_id: str, master_answer: str, master_hash: str) -> MasterProfile:
+    """
+    Runs everything that depends only on the master answer: one LLM extraction,
+    normalization, equation embeddings, description substitution and the
+    SBERT/E5 encodes of the descriptive text.
+    """
+    with metrics.timed("extraction"):
+        extractions = extract_equations_from_text(master_answer, model_name, required=True, label="master")
+    return encode_master_profile(question_id, master_answer, master_hash, extractions)
+
+
+async def abuild_master_profile(question_id: str, master_answer: str, master_hash: str) -> MasterProfile:
+    # Async variant: the LLM call is awaited, the encodes run in a worker thread
+    extractions = await aextract_timed(master_answer, required=True, label="master")
+    return await asyncio.to_thread(encode_master_profile, question_id, master_answer, master_hash, extractions)
+
+
+async def aextract_timed(answer: str, required: bool = False, label: str = "student") -> list:
+    # Async extraction recorded under the "extraction" stage
+    with metrics.timed("extraction"):
+        return await aextract_equations_from_text(answer, model_name, required=required, label=label)
+
+
+def encode_master_profile(question_id: str, master_answer: str, master_hash: str, extractions: list) -> MasterProfile:
+    process_extractions(extractions, normalize_equation)
+
+    with metrics.timed("equation_scoring"):
+        equation_vectors = embed_texts(
+            [equation_text(eq) for eq in extractions], embedding_model, equation_embedding_cache
+        )
+    with metrics.timed("text_substitution"):
+        descriptive_text = replace_equations_with_descriptions(master_answer, extractions)
+    with metrics.timed("sbert"):
+        sbert_vector = sbert_vectors([descriptive_text])[0]
+    with metrics.timed("e5"):
+        e5_vector = e5_vectors([descriptive_text])[0]
+
+    return MasterProfile(
+        question_id=question_id,
+        master_hash=master_hash,
+        master_answer=master_answer,
+        extractions=extractions,
+        equation_vectors=equation_vectors,
+        descriptive_text=descriptive_text,
+        sbert_vector=sbert_vector,
+        e5_vector=e5_vector,
+    )
+
+
+async def awarm_master_profile(question_id: str, master_answer: str) -> dict:
+    """
+    Builds (or loads) the master profile ahead of grading, e.g. right after
+    the master answer is stored, so the first analysis skips the master
+    extraction and encodes.
+    """
+    profile = await master_profiles.aget_or_build(question_id, master_answer, abuild_master_profile)
+    store = master_profiles.store
+    return {
+        "questionId": question_id,
+        "master_hash": profile.master_hash,
+        "equation_count": len(profile.extractions),
+        "artifact": store.path(question_id, profile.master_hash) if store is not None else None,
+    }
+
+
+def prepare_student(profile: MasterProfile, student_entry: dict) -> dict:
+    """
+    Extracts and scores one student's equations against the master profile
+    and builds the descriptive student text.
+    """
+    # 1. Extract equations (blank answers have none to extract)
+    student_extractions = []
+    if not scoring_policy.is_blank(student_entry["answerText"]):
+        with metrics.timed("extraction"):
+            student_extractions = extract_equations_from_text(student_entry["answerText"], model_name)
+    return grade_student_equations(profile, student_entry, student_extractions)
+
+
+async def aextract_student(student_entry: dict) -> list:
+    if scoring_policy.is_blank(student_entry["answerText"]):
+        return []
+    return await aextract_timed(student_entry["answerText"])
+
+
+def grade_student_equations(profile: MasterProfile, student_entry: dict, student_extractions: list) -> dict:
+    student_answer = student_entry["answerText"]
+    process_extractions(student_extractions, normalize_equation)
+
+    # 2. Equation scoring
+    with metrics.timed("equation_scoring"):
+        eq_score_result = score_equations(
+            profile.extractions,
+            student_extractions,
+            embedding_model,
+            equation_embedding_cache,
+            master_vectors=profile.equation_vectors
+        )
+
+    # 3. Replace equations with descriptions
+    with metrics.timed("text_substitution"):
+        descriptive_student_text = replace_equations_with_descriptions(student_answer, student_extractions)
+
+    return {
+        "student_id": student_entry["userId"],
+        "blank": scoring_policy.is_blank(student_answer),
+        "extractions": student_extractions,
+        "final_equation_score": eq_score_result["final_equation_score"],
+        "feedback_matrix": eq_score_result["feedback_matrix"],
+        "descriptive_text": descriptive_student_text,
+    }
+
+
+def _sbert_scores(profile: MasterProfile, texts: list):
+    return batch_cosine_scores(profile.sbert_vector, sbert_vectors(texts))
+
+def _e5_scores(profile: MasterProfile, texts: list):
+    return batch_cosine_scores(profile.e5_vector, e5_vectors(texts))
+
+# Text scorers the policy can run, by name: fn(profile, descriptive texts) -> one similarity per text
+TEXT_SCORERS = {"sbert": _sbert_scores, "e5": _e5_scores}
+
+
+def score_texts_batch(profile: MasterProfile, graded: list) -> list:
+    """
+    Runs the policy's text scorers cheapest-first over the students that
+    still need them, each as one batched encode. Students whose verdict is
+    already decided (or whose answer is blank) skip the remaining scorers.
+
+    Returns:
+        One dict per student of the scores computed, e.g. {"equation", "sbert"}.
+    """
+    scores = [
+        dict.fromkeys(["equation"] + scoring_policy.text_scorers(), 0.0) if g["blank"]
+        else {"equation": g["final_equation_score"]}
+        for g in graded
+    ]
+    for name in scoring_policy.text_scorers():
+        needed = [i for i, known in enumerate(scores) if not scoring_policy.decided(known)]
+        if not needed:
+            break
+        with metrics.timed(name):
+            values = TEXT_SCORERS[name](profile, [graded[i]["descriptive_text"] for i in needed])
+        for i, value in zip(needed, values):
+            scores[i][name] = float(value)
+    for known, g in zip(scores, graded):
+        skipped = scoring_policy.text_scorers() if g["blank"] else scoring_policy.skipped(known)
+        for name in skipped:
+            metrics.scorers_skipped.labels(scorer=name, reason="blank" if g["blank"] else "decided").inc()
+    return scores
+
+
+def plan_feedback(graded: dict, scores: dict):
+    """
+    Final score and verdict for one student under the scoring policy, and
+    the template feedback to use instead of an LLM call (None when the LLM
+    should write it).
+    """
+    final_score = scoring_policy.final_score(scores)
+    verdict = scoring_policy.verdict(final_score)
+    template = None
+    if scoring_policy.use_template(verdict, graded["blank"]):
+        unmatched = [eq["equation"] for eq in graded["feedback_matrix"]]
+        template = template_feedback(verdict, final_score, unmatched, blank=graded["blank"])
+        metrics.feedback_generated.labels(kind="template").inc()
+    else:
+        metrics.feedback_generated.labels(kind="llm").inc()
+    return final_score, template
+
+
+def student_result(graded: dict, scores: dict, final_score: float, feedback) -> dict:
+    result = {
+        "student_id": graded["student_id"],
+        "final_score": final_score,
+        "feedback": feedback
+    }
+    skipped = scoring_policy.skipped(scores)
+    if skipped:
+        result["skipped_scorers"] = skipped
+    return result
+
+
+def finish_student(profile: MasterProfile, graded: dict, scores: dict) -> dict:
+    # 5. Final score
+    final_score, feedback = plan_feedback(graded, scores)
+
+    # 6. Generate feedback (unless the policy gives a template for this verdict)
+    if feedback is None:
+        filled = scoring_policy.filled(scores)
+        with metrics.timed("feedback"):
+            feedback = generate_semantic_feedback(
+                profile.descriptive_text,
+                graded["descriptive_text"],
+                graded["feedback_matrix"],
+                graded["final_equation_score"],
+                filled["sbert"],
+                filled["e5"],
+                final_score,
+                model_name
+            )
+
+    return student_result(graded, scores, final_score, feedback)
+
+
+async def afinish_student(profile: MasterProfile, graded: dict, scores: dict) -> dict:
+    final_score, feedback = plan_feedback(graded, scores)
+    if feedback is None:
+        filled = scoring_policy.filled(scores)
+        with metrics.timed("feedback"):
+            feedback = await agenerate_semantic_feedback(
+                profile.descriptive_text,
+                graded["descriptive_text"],
+                graded["feedback_matrix"],
+                graded["final_equation_score"],
+                filled["sbert"],
+                filled["e5"],
+                final_score,
+                model_name
+            )
+    return student_result(graded, scores, final_score, feedback)
+
+
+def grade_students(question_id: str, master_answer: str, student_data: list) -> list:
+    # Master-side work happens once per question (and master text version)
+    profile = master_profiles.get_or_build(question_id, master_answer, build_master_profile)
+
+    # 1-3. Per-student extraction, equation scoring and description substitution
+    graded = [prepare_student(profile, student_entry) for student_entry in student_data]
+
+    # 4. SBERT and E5 scores for the whole class in a few batched forward passes
+    scores = score_texts_batch(profile, graded)
+
+    results = []
+
+    for g, student_scores in zip(graded, scores):
+        results.append(finish_student(profile, g, student_scores))
+
+    return results
+
+
+async def agrade_students(question_id: str, master_answer: str, student_data: list) -> list:
+    # Master profile and student extractions in parallel
+    profile, *student_extractions = await asyncio.gather(
+        master_profiles.aget_or_build(question_id, master_answer, abuild_master_profile),
+        *(aextract_student(entry) for entry in student_data)
+    )
+
+    graded = await asyncio.gather(*(
+        asyncio.to_thread(grade_student_equations, profile, entry, extractions)
+        for entry, extractions in zip(student_data, student_extractions)
+    ))
+
+    scores = await run_scoring(score_texts_batch, profile, list(graded))
+
+    # Feedback for every student concurrently
+    return list(await asyncio.gather(*(
+        afinish_student(profile, g, student_scores) for g, student_scores in zip(graded, scores)
+    )))
+
+
+def scoring_config_version() -> str:
+    # Anything that changes a graded result must be part of the result cache key
+    reuse = f".dup{NEAR_DUPLICATE_THRESHOLD}-{NEAR_DUPLICATE_MAX_SCORE_DELTA}" if NEAR_DUPLICATE_REUSE else ""
+    return f"{SCORING_VERSION}.{PROFILE_VERSION}.{model_name}{_backend_suffix}{reuse}.{scoring_policy.version}"
+
+
+def lookup_cached_results(question_id: str, master_answer: str, student_data: list):
+    """
+    Looks up each student's result in the result cache.
+
+    Returns:
+        A tuple (keys, cached) where cached holds the cached result or None per student.
+    """
+    version = scoring_config_version()
+    keys = [ResultCache.make_key(question_id, master_answer, entry["answerText"], version) for entry in student_data]
+    if result_cache is None:
+        return keys, [None] * len(keys)
+    return keys, [result_cache.get(key) for key in keys]
+
+
+def store_results(question_id: str, keys: list, results: list):
+    if result_cache is None:
+        return
+    for key, result in zip(keys, results):
+        # Don't pin a result whose feedback failed to parse; let the next request retry it
+        if result.get("feedback") is not None:
+            result_cache.put(key, question_id, result)
+
+
+def _cache_status(pending: list, total: int) -> str:
+    if not pending:
+        return "HIT"
+    return "MISS" if len(pending) == total else "PARTIAL"
+
+
+def analyze_question_from_db(question_id: str, user_id: str, master_container, student_container, cache_info: dict = None):
+    with metrics.timed("cosmos_fetch"):
+        data = fetch_answers_from_cosmos(question_id, user_id, master_container, student_container)
     
     if "error" in data:
         return data
@@ -80,52 +628,229 @@ def analyze_question_from_db(question_id: str, user_id: str, master_container, s
     if not student_data:
         return {"error": "❌ No student answers found."}
 
-    results = []
+    # Only students without a cached result for this exact content are graded
+    keys, results = lookup_cached_results(question_id, master_answer, student_data)
+    pending = [i for i, cached in enumerate(results) if cached is None]
+    if pending:
+        fresh = grade_students(question_id, master_answer, [student_data[i] for i in pending])
+        store_results(question_id, [keys[i] for i in pending], fresh)
+        for i, result in zip(pending, fresh):
+            results[i] = result
 
-    for student_entry in student_data:
-        student_id = student_entry["userId"]
-        student_answer = student_entry["answerText"]
-
-        # 1. Extract equations
-        result = extract_equations(master_answer, student_answer, model_name)
-        process_extractions(result["master_extractions"], normalize_equation)
-        process_extractions(result["student_extractions"], normalize_equation)
-
-        # 2. Equation scoring
-        eq_score_result = score_equations(result["master_extractions"], result["student_extractions"], embedding_model)
-        final_equation_score = eq_score_result["final_equation_score"]
-        feedback_matrix = eq_score_result["feedback_matrix"]
-
-        # 3. Replace equations with descriptions
-        descriptive_master_text = replace_equations_with_descriptions(master_answer, result["master_extractions"])
-        descriptive_student_text = replace_equations_with_descriptions(student_answer, result["student_extractions"])
-
-        # 4. SBERT and E5 scores
-        sbert_score = calculate_sbert_similarity(descriptive_master_text, descriptive_student_text, sbert_model)
-        e5_score = calculate_e5_similarity(descriptive_master_text, descriptive_student_text, e5_tokenizer, e5_model)
-
-        # 5. Final score
-        final_score = calculate_final_score(final_equation_score, sbert_score, e5_score)
-
-        # 6. Generate feedback
-        feedback = generate_semantic_feedback(
-            descriptive_master_text,
-            descriptive_student_text,
-            feedback_matrix,
-            final_equation_score,
-            sbert_score,
-            e5_score,
-            final_score,
-            model_name
-        )
+    if cache_info is not None:
+        cache_info["status"] = _cache_status(pending, len(student_data))
 
-        results.append({
-            "student_id": student_id,
-            "final_score": final_score,
-            "feedback": feedback
-        })
+    return {
+        "questionId": question_id,
+        "results": results
+    }
+
+
+async def analyze_question_from_db_async(question_id: str, user_id: str, master_container, student_container, cache_info: dict = None):
+    """
+    Asyncio-native variant of analyze_question_from_db.
+
+    The master profile and every student extraction run concurrently, CPU and
+    blocking I/O stages run in worker threads, and feedback calls fan out per
+    student, all bounded by LLM_CONCURRENCY. Wall-clock time tracks the
+    slowest student instead of the sum over students. The containers are
+    azure.cosmos.aio containers (or InMemoryContainer.aio).
+    """
+    with metrics.timed("cosmos_fetch"):
+        data = await afetch_answers_from_cosmos(question_id, user_id, master_container, student_container)
+
+    if "error" in data:
+        return data
+
+    master_answer = data["master_answer"]
+    student_data = data["student_answers"]
+
+    if not master_answer:
+        return {"error": "❌ Master answer not found."}
+    if not student_data:
+        return {"error": "❌ No student answers found."}
+
+    keys, results = await asyncio.to_thread(lookup_cached_results, question_id, master_answer, student_data)
+    pending = [i for i, cached in enumerate(results) if cached is None]
+    if pending:
+        fresh = await agrade_students(question_id, master_answer, [student_data[i] for i in pending])
+        await asyncio.to_thread(store_results, question_id, [keys[i] for i in pending], fresh)
+        for i, result in zip(pending, fresh):
+            results[i] = result
+
+    if cache_info is not None:
+        cache_info["status"] = _cache_status(pending, len(student_data))
 
     return {
         "questionId": question_id,
         "results": results
     }
+
+
+def find_near_duplicates(student_data: list):
+    # SBERT embeddings of the raw answers, clustered greedily (index -> (representative index, similarity))
+    with metrics.timed("near_duplicates"):
+        vectors = sbert_vectors([entry["answerText"] for entry in student_data])
+        return cluster_near_duplicates(list(range(len(student_data))), vectors)
+
+
+def duplicate_followers(student_data: list, pending: list, assignment: dict):
+    """
+    Picks the pending answers that can reuse another pending answer's work:
+    near-duplicates of a representative that is graded in the same run and
+    states the same equations.
+
+    Returns:
+        A dict mapping each representative index to [(follower index, similarity), ...].
+    """
+    pending_set = set(pending)
+    followers = {}
+    for i in pending:
+        representative, similarity = assignment.get(i, (i, 1.0))
+        if representative == i or representative not in pending_set:
+            continue
+        if math_signature(student_data[i]["answerText"]) != math_signature(student_data[representative]["answerText"]):
+            continue
+        followers.setdefault(representative, []).append((i, similarity))
+    return followers
+
+
+async def astream_grade_students(question_id: str, master_answer: str, student_data: list, duplicate_info: dict = None):
+    """
+    Grades a class and yields (index, result) pairs as soon as each student
+    is finished, instead of waiting for the slowest one.
+
+    Cached results are yielded first. Students whose extraction has finished
+    are scored together in one SBERT/E5 batch, then their feedback calls fan
+    out. A failing student yields {"student_id", "error"} and does not stop
+    the others.
+
+    Near-duplicate answers (core/duplicates.py) reuse their representative's
+    extraction, and its feedback when the final scores are within
+    NEAR_DUPLICATE_MAX_SCORE_DELTA and share a verdict; their results carry "duplicate_of" and
+    "similarity". duplicate_info, when given, receives the copy clusters of
+    the whole class under "clusters".
+    """
+    keys, cached = await asyncio.to_thread(lookup_cached_results, question_id, master_answer, student_data)
+    pending = []
+    for i, result in enumerate(cached):
+        if result is not None:
+            yield i, result
+        else:
+            pending.append(i)
+
+    assignment = {}
+    if len(student_data) > 1 and (duplicate_info is not None or (NEAR_DUPLICATE_REUSE and len(pending) > 1)):
+        assignment = await run_scoring(find_near_duplicates, student_data)
+    if duplicate_info is not None:
+        duplicate_info["clusters"] = duplicate_clusters(
+            assignment, {i: entry.get("userId") for i, entry in enumerate(student_data)}
+        )
+    if not pending:
+        return
+
+    followers = duplicate_followers(student_data, pending, assignment) if NEAR_DUPLICATE_REUSE else {}
+    representative_of = {i: (rep, similarity) for rep, members in followers.items() for i, similarity in members}
+
+    profile = await master_profiles.aget_or_build(question_id, master_answer, abuild_master_profile)
+
+    async def extract(i):
+        return await aextract_student(student_data[i])
+
+    async def finish(i, graded, scores):
+        result = await afinish_student(profile, graded, scores)
+        await asyncio.to_thread(store_results, question_id, [keys[i]], [result])
+        return result
+
+    async def finish_duplicate(i, graded, scores, representative_task):
+        representative, similarity = representative_of[i]
+        try:
+            representative_result = await representative_task
+        except Exception:
+            representative_result = {}
+        final_score = scoring_policy.final_score(scores)
+        feedback = representative_result.get("feedback")
+        # Copied feedback must describe the same verdict, not just a nearby score
+        reusable = (
+            feedback is not None
+            and abs(final_score - representative_result["final_score"]) <= NEAR_DUPLICATE_MAX_SCORE_DELTA
+            and scoring_policy.verdict(final_score) == scoring_policy.verdict(representative_result["final_score"])
+        )
+        if reusable:
+            metrics.near_duplicate_reuse.labels(stage="feedback").inc()
+            result = student_result(graded, scores, final_score, dict(feedback, score_out_of_10=final_score))
+        else:
+            result = await afinish_student(profile, graded, scores)
+        result["duplicate_of"] = student_data[representative].get("userId")
+        result["similarity"] = round(similarity, 4)
+        await asyncio.to_thread(store_results, question_id, [keys[i]], [result])
+        return result
+
+    tasks = {asyncio.create_task(extract(i)): ("extract", i) for i in pending if i not in representative_of}
+    finish_tasks = {}
+    while tasks:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        extracted = []
+        for task in done:
+            stage, i = tasks.pop(task)
+            student_id = student_data[i].get("userId")
+            if task.exception() is not None:
+                yield i, {"student_id": student_id, "error": str(task.exception())}
+                # Duplicates of a failed extraction fall back to their own
+                for j, _ in followers.pop(i, []) if stage == "extract" else []:
+                    representative_of.pop(j)
+                    tasks[asyncio.create_task(extract(j))] = ("extract", j)
+            elif stage == "extract":
+                extracted.append((i, task.result()))
+                for j, _ in followers.get(i, []):
+                    metrics.near_duplicate_reuse.labels(stage="extraction").inc()
+                    # Own copy: grading normalizes the extraction dicts in place
+                    extracted.append((j, copy.deepcopy(task.result())))
+            else:
+                yield i, task.result()
+
+        if extracted:
+            # Everything that finished extraction together shares one scoring batch
+            try:
+                graded = await asyncio.gather(*(
+                    asyncio.to_thread(grade_student_equations, profile, student_data[i], extractions)
+                    for i, extractions in extracted
+                ))
+                scores = await run_scoring(score_texts_batch, profile, list(graded))
+            except Exception as e:
+                for i, _ in extracted:
+                    yield i, {"student_id": student_data[i].get("userId"), "error": str(e)}
+                continue
+            # Representatives come before their duplicates in extracted, so their tasks exist first
+            for (i, _), g, student_scores in zip(extracted, graded, scores):
+                if i in representative_of:
+                    coro = finish_duplicate(i, g, student_scores, finish_tasks[representative_of[i][0]])
+                else:
+                    coro = finish(i, g, student_scores)
+                finish_tasks[i] = asyncio.create_task(coro)
+                tasks[finish_tasks[i]] = ("finish", i)
+
+
+async def analyze_question_all_students_async(question_id: str, master_container, student_container):
+    """
+    Grades every student answer for a question and returns the results in
+    the order they were fetched (used by background jobs). Takes
+    azure.cosmos.aio containers.
+    """
+    with metrics.timed("cosmos_fetch"):
+        data = await afetch_question_answers_from_cosmos(question_id, master_container, student_container)
+    if "error" in data:
+        return data
+
+    results = [None] * len(data["student_answers"])
+    duplicate_info = {}
+    async for i, result in astream_grade_students(
+        question_id, data["master_answer"], data["student_answers"], duplicate_info=duplicate_info
+    ):
+        results[i] = result
+
+    return {
+        "questionId": question_id,
+        "results": results,
+        "duplicate_clusters": duplicate_info.get("clusters", [])
+    }
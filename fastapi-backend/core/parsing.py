@@ -0,0 +1,81 @@
+# parsing.py
+
+import json
+
+_decoder = json.JSONDecoder(strict=False)
+
+
+class LLMOutputError(ValueError):
+    """Raised when LLM output can't be turned into the expected JSON."""
+
+
+def strip_fences(text: str) -> str:
+    # Drop markdown code fences (```json ... ```) wherever they are
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    if text.rstrip().endswith("```"):
+        text = text.rstrip()[:-3]
+    return text.strip().strip("`").strip()
+
+
+def _iter_objects(text: str, start: int = 0):
+    """
+    Yields every complete top-level JSON object found from start on,
+    skipping anything that doesn't decode (stray prose, a truncated tail).
+    """
+    pos = text.find("{", start)
+    while pos != -1:
+        try:
+            obj, end = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            pos = text.find("{", pos + 1)
+            continue
+        if isinstance(obj, dict):
+            yield obj
+        pos = text.find("{", end)
+
+
+def parse_json_array(text: str) -> list:
+    """
+    Parses a JSON array out of LLM output, tolerating markdown fences, text
+    before or after the array and truncated output.
+
+    The first well-formed array is returned as is. Otherwise every complete
+    object after the opening bracket is recovered, so a cut-off response
+    still yields the equations that made it through.
+    """
+    text = strip_fences(text)
+    if not text:
+        return []
+
+    start = text.find("[")
+    while start != -1:
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            if isinstance(value, list):
+                return value
+        except json.JSONDecodeError:
+            pass
+        # Decorated or partial array: salvage the complete objects inside it
+        recovered = list(_iter_objects(text, start))
+        if recovered:
+            return recovered
+        start = text.find("[", start + 1)
+
+    # No array at all: a bare object (or several) is still usable
+    recovered = list(_iter_objects(text))
+    if recovered:
+        return recovered
+    raise LLMOutputError(f"No JSON array found in LLM output: {text[:200]!r}")
+
+
+def parse_json_object(text: str) -> dict:
+    """
+    Parses the first complete JSON object out of LLM output, ignoring
+    fences and surrounding text.
+    """
+    text = strip_fences(text)
+    for obj in _iter_objects(text):
+        return obj
+    raise LLMOutputError(f"No JSON object found in LLM output: {text[:200]!r}")
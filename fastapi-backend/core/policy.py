@@ -0,0 +1,136 @@
+# policy.py
+"""
+Scoring policy: how scorer results are fused into the final score, which
+scorers run, and when feedback comes from a template instead of the LLM.
+
+The equation score always comes first (it is a by-product of extraction);
+the text scorers then run cheapest-first. A student stops being scored as
+soon as the scorers still missing can no longer move the rounded final
+score across a verdict boundary, assuming each one lands somewhere in its
+declared range; a skipped scorer counts as the middle of its range. Blank
+answers are never extracted or encoded and get template feedback.
+
+The default policy runs every scorer with the fixed 0.5 / 0.25 / 0.25
+weights and always asks the LLM for feedback, so its scores match
+scorers.calculate_final_score. Early stopping and template feedback are
+opt-in: load another policy with SCORING_POLICY_PATH (a JSON object with
+any of the ScoringPolicy fields, e.g. policies/early_stop.json). The
+policy version is part of the result cache key, so a given version always
+yields the same scores.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+
+SCORING_POLICY_PATH = os.getenv("SCORING_POLICY_PATH")
+
+DEFAULT_VERDICTS = ((9, "Outstanding"), (7.5, "Excellent"), (6, "Good"), (4, "Fair"), (2, "Not Good"), (0, "Bad"))
+
+
+@dataclass(frozen=True)
+class ScoringPolicy:
+    """
+    Attributes:
+        name: Label reported with the policy version.
+        weights: Weight per scorer ("equation", "sbert", "e5"); 0 never runs a scorer.
+        order: Text scorers, cheapest first.
+        ranges: Assumed [low, high] of each scorer's similarity, used for early stopping.
+        early_stop: Skip scorers that cannot change the verdict.
+        verdicts: (minimum score, verdict) pairs, highest first.
+        template_verdicts: Verdicts clear-cut enough for template feedback instead of an LLM call.
+        blank_min_chars: Answers shorter than this (after stripping) count as blank.
+    """
+
+    name: str = "default"
+    weights: dict = field(default_factory=lambda: {"equation": 0.5, "sbert": 0.25, "e5": 0.25})
+    order: tuple = ("sbert", "e5")
+    # E5 cosine similarities cluster high even for unrelated texts
+    ranges: dict = field(default_factory=lambda: {"equation": (0.0, 1.0), "sbert": (0.0, 1.0), "e5": (0.7, 1.0)})
+    early_stop: bool = False
+    verdicts: tuple = DEFAULT_VERDICTS
+    template_verdicts: tuple = ()
+    blank_min_chars: int = 1
+
+    @classmethod
+    def from_dict(cls, config: dict):
+        config = dict(config)
+        for key in ("order", "template_verdicts"):
+            if key in config:
+                config[key] = tuple(config[key])
+        if "verdicts" in config:
+            config["verdicts"] = tuple((float(bound), name) for bound, name in config["verdicts"])
+        if "ranges" in config:
+            config["ranges"] = {**cls().ranges, **{name: tuple(bounds) for name, bounds in config["ranges"].items()}}
+        return cls(**config)
+
+    @property
+    def version(self) -> str:
+        digest = hashlib.sha256(json.dumps(asdict(self), sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{self.name}-{digest[:8]}"
+
+    def text_scorers(self):
+        return [name for name in self.order if self.weights.get(name, 0) > 0]
+
+    def is_blank(self, answer_text: str) -> bool:
+        return len((answer_text or "").strip()) < self.blank_min_chars
+
+    def verdict(self, score: float) -> str:
+        return next((name for bound, name in self.verdicts if score >= bound), self.verdicts[-1][1])
+
+    def _total(self, scores: dict, pick) -> float:
+        return round(sum(
+            weight * (scores[name] if name in scores else pick(self.ranges[name]))
+            for name, weight in self.weights.items()
+        ) * 10, 1)
+
+    def interval(self, scores: dict):
+        """Lowest and highest final score still possible given the scores computed so far."""
+        return self._total(scores, lambda r: r[0]), self._total(scores, lambda r: r[1])
+
+    def decided(self, scores: dict) -> bool:
+        # True once the remaining scorers cannot change the verdict
+        if all(name in scores for name in self.text_scorers()):
+            return True
+        if not self.early_stop:
+            return False
+        low, high = self.interval(scores)
+        return self.verdict(low) == self.verdict(high)
+
+    def filled(self, scores: dict) -> dict:
+        # Scores with each skipped scorer at the middle of its range
+        return {name: scores.get(name, sum(self.ranges[name]) / 2) for name in self.weights}
+
+    def final_score(self, scores: dict) -> float:
+        return self._total(self.filled(scores), lambda r: 0.0)
+
+    def skipped(self, scores: dict):
+        return [name for name in self.text_scorers() if name not in scores]
+
+    def use_template(self, verdict: str, blank: bool = False) -> bool:
+        return blank or verdict in self.template_verdicts
+
+
+def template_feedback(verdict: str, final_score: float, unmatched_equations, blank: bool = False) -> dict:
+    """Feedback in the same shape as the LLM's, for blank answers and clear-cut verdicts."""
+    if blank:
+        comment = "No answer was submitted."
+        advice = "Write out your reasoning and the equations you use, even if you are unsure."
+    elif final_score >= 5:
+        comment = "Your answer covers the key ideas and equations of the model answer."
+        advice = "Keep explaining each step as clearly as you did here."
+    elif unmatched_equations:
+        comment = "Your answer misses most of the key ideas; it should have included " + ", ".join(unmatched_equations) + "."
+        advice = "Review " + ", ".join(unmatched_equations) + " and explain how each one applies to the question."
+    else:
+        comment = "Your answer misses most of the key ideas of the model answer."
+        advice = "Review the worked solution and explain each step and equation in your own words."
+    return {"score_out_of_10": final_score, "verdict": verdict, "comment": comment, "advice": advice}
+
+
+def load_policy(path: str = SCORING_POLICY_PATH) -> ScoringPolicy:
+    if not path:
+        return ScoringPolicy()
+    with open(path, encoding="utf-8") as f:
+        return ScoringPolicy.from_dict(json.load(f))
@@ -0,0 +1,214 @@
+# profiles.py
+
+import asyncio
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from core.cache import text_hash
+
+# Bump whenever the way a profile is built changes, so stale profiles are rebuilt
+PROFILE_VERSION = 1
+
+
+@dataclass
+class MasterProfile:
+    """Everything derived from a master answer that is shared by all students."""
+
+    question_id: str
+    master_hash: str
+    master_answer: str
+    extractions: list
+    equation_vectors: np.ndarray
+    descriptive_text: str
+    sbert_vector: np.ndarray
+    e5_vector: np.ndarray
+    version: int = PROFILE_VERSION
+
+
+class MasterProfileStore:
+    """
+    Master profiles persisted as small on-disk artifacts, so a profile built
+    once (e.g. warmed when the master answer is uploaded) loads in
+    milliseconds in every process and after restarts.
+
+    Each artifact is a directory {question}/{master_hash}-{config}/ holding
+    meta.json (texts and extractions) and equation_vectors.npy, sbert.npy
+    and e5.npy, which are loaded memory-mapped. config identifies the models
+    that produced the vectors. Artifacts are written to a temporary
+    directory and renamed into place, so readers never see a partial one.
+    """
+
+    VECTORS = ("equation_vectors", "sbert_vector", "e5_vector")
+
+    def __init__(self, directory: str, config: str):
+        self.directory = directory
+        self.config = text_hash(f"{PROFILE_VERSION}|{config}")[:12]
+
+    def _question_dir(self, question_id: str) -> str:
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_-]+", "_", question_id) + "-" + text_hash(question_id)[:8])
+
+    def path(self, question_id: str, master_hash: str) -> str:
+        return os.path.join(self._question_dir(question_id), f"{master_hash}-{self.config}")
+
+    def load(self, question_id: str, master_hash: str):
+        """Returns the stored MasterProfile, or None if there is no artifact for this master text and config."""
+        path = self.path(question_id, master_hash)
+        try:
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in self.VECTORS}
+        except (FileNotFoundError, ValueError):
+            return None
+        return MasterProfile(
+            question_id=meta["question_id"],
+            master_hash=meta["master_hash"],
+            master_answer=meta["master_answer"],
+            extractions=meta["extractions"],
+            descriptive_text=meta["descriptive_text"],
+            version=meta["version"],
+            **vectors,
+        )
+
+    def save(self, profile: MasterProfile) -> str:
+        """Writes the artifact for profile and removes this question's artifacts for older master texts."""
+        path = self.path(profile.question_id, profile.master_hash)
+        if os.path.isdir(path):
+            return path
+        question_dir = os.path.dirname(path)
+        tmp_path = os.path.join(question_dir, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_path)
+        try:
+            for name in self.VECTORS:
+                np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(getattr(profile, name), dtype=np.float32))
+            meta = {
+                "question_id": profile.question_id,
+                "master_hash": profile.master_hash,
+                "master_answer": profile.master_answer,
+                "extractions": profile.extractions,
+                "descriptive_text": profile.descriptive_text,
+                "version": profile.version,
+            }
+            with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process finished the same artifact first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        for name in os.listdir(question_dir):
+            if name.endswith(f"-{self.config}") and name != os.path.basename(path):
+                shutil.rmtree(os.path.join(question_dir, name), ignore_errors=True)
+        return path
+
+
+class MasterProfileCache:
+    """
+    Keeps one MasterProfile per questionId.
+
+    A cached profile is reused only while the master answer hash and
+    PROFILE_VERSION still match; otherwise it is rebuilt. Concurrent requests
+    for the same question wait for a single build. With a MasterProfileStore,
+    a missing profile is loaded from disk before building, and new builds are
+    saved to it.
+    """
+
+    def __init__(self, max_entries: int = 1024, store: MasterProfileStore = None):
+        self.max_entries = max_entries
+        self.store = store
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._async_build_locks = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.builds = 0
+
+    def _lookup(self, question_id: str, master_hash: str):
+        with self._lock:
+            profile = self._profiles.get(question_id)
+            if profile is None or profile.master_hash != master_hash or profile.version != PROFILE_VERSION:
+                return None
+            self._profiles.move_to_end(question_id)
+            self.hits += 1
+            return profile
+
+    def put(self, profile: MasterProfile):
+        with self._lock:
+            self._profiles[profile.question_id] = profile
+            self._profiles.move_to_end(profile.question_id)
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+
+    def invalidate(self, question_id: str):
+        with self._lock:
+            self._profiles.pop(question_id, None)
+
+    def _load_stored(self, question_id: str, master_hash: str):
+        if self.store is None:
+            return None
+        profile = self.store.load(question_id, master_hash)
+        if profile is not None and profile.version == PROFILE_VERSION:
+            self.disk_hits += 1
+            self.put(profile)
+            return profile
+        return None
+
+    def _save_stored(self, profile: MasterProfile):
+        if self.store is not None:
+            self.store.save(profile)
+
+    def get_or_build(self, question_id: str, master_answer: str, build):
+        """
+        Returns the cached profile for question_id, building it with
+        build(question_id, master_answer, master_hash) if missing or stale.
+        """
+        master_hash = text_hash(master_answer)
+        profile = self._lookup(question_id, master_hash)
+        if profile is not None:
+            return profile
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(question_id, threading.Lock())
+        with build_lock:
+            # Another request may have built it while we waited
+            profile = self._lookup(question_id, master_hash) or self._load_stored(question_id, master_hash)
+            if profile is None:
+                profile = build(question_id, master_answer, master_hash)
+                self.builds += 1
+                self.put(profile)
+                self._save_stored(profile)
+        return profile
+
+    async def aget_or_build(self, question_id: str, master_answer: str, abuild):
+        """
+        Async variant of get_or_build; abuild is awaited and concurrent
+        coroutines for the same question share one build.
+        """
+        master_hash = text_hash(master_answer)
+        profile = self._lookup(question_id, master_hash)
+        if profile is not None:
+            return profile
+
+        build_lock = self._async_build_locks.setdefault(question_id, asyncio.Lock())
+        async with build_lock:
+            profile = self._lookup(question_id, master_hash)
+            if profile is None:
+                profile = await asyncio.to_thread(self._load_stored, question_id, master_hash)
+            if profile is None:
+                profile = await abuild(question_id, master_answer, master_hash)
+                self.builds += 1
+                self.put(profile)
+                await asyncio.to_thread(self._save_stored, profile)
+        return profile
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "builds": self.builds, "entries": len(self._profiles)}
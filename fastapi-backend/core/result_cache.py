@@ -0,0 +1,111 @@
+# result_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from core.cache import text_hash
+
+
+class ResultCache:
+    """
+    SQLite-backed cache of per-student analysis results.
+
+    Entries are keyed by (questionId, master text hash, student text hash,
+    scoring version), expire after ttl_seconds and are evicted
+    least-recently-used once more than max_entries are stored. A hit only
+    refreshes accessed_at when it is older than touch_interval seconds, so
+    most hits are plain reads and don't take SQLite's write lock.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 86400, max_entries: int = 10000, touch_interval: float = 300):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    question_id TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        # Short-lived connection per operation: safe across threads, committed on exit
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(question_id: str, master_text: str, student_text: str, version: str) -> str:
+        raw = "|".join([question_id, text_hash(master_text), text_hash(student_text), str(version)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at, accessed_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                with self._lock:
+                    self.misses += 1
+                return None
+            # LRU order only needs touch_interval resolution
+            if now - row[2] > self.touch_interval:
+                conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, question_id: str, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, question_id, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, question_id, json.dumps(value), now, now),
+            )
+        with self._lock:
+            self._puts_since_evict += 1
+            evict = self._puts_since_evict >= 100
+            if evict:
+                self._puts_since_evict = 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        # Drop expired rows, then the least recently used ones beyond max_entries
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                """
+                DELETE FROM results WHERE key IN (
+                    SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,30 +1,88 @@
 # scorers.py
 
-from sentence_transformers import util
+import os
+
+import numpy as np
 import torch
 import torch.nn.functional as F
 
+# Bump whenever scoring weights or formulas change (part of the result cache key)
+SCORING_VERSION = 1
+
+# Batch sizes for the batched encode paths (tune per node; E5-large is the expensive one)
+SBERT_BATCH_SIZE = int(os.getenv("SBERT_BATCH_SIZE", "32"))
+E5_BATCH_SIZE = int(os.getenv("E5_BATCH_SIZE", "8"))
+
+
+def configure_torch_threads(num_threads=None):
+    # Intra-op threads for CPU inference; defaults to TORCH_NUM_THREADS or torch's own choice
+    num_threads = num_threads or os.getenv("TORCH_NUM_THREADS")
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+
 
-def calculate_sbert_similarity(master_text, student_text, sbert_model):
-    sbert_master = sbert_model.encode(master_text, convert_to_tensor=True)
-    sbert_student = sbert_model.encode(student_text, convert_to_tensor=True)
-    return util.cos_sim(sbert_master, sbert_student).item()
+def cosine_similarity(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(np.dot(a, b) / denom) if denom else 0.0
 
-def calculate_e5_similarity(master_text, student_text, tokenizer, model):
+def encode_sbert(texts, sbert_model, cache=None, batch_size=SBERT_BATCH_SIZE):
     """
-    Calculates the E5 cosine similarity between two texts.
+    Encodes texts with SBERT in batches, reusing cached embeddings when a cache is given.
     """
+    def compute(batch):
+        with torch.inference_mode():
+            return sbert_model.encode(batch, batch_size=batch_size, convert_to_numpy=True)
+
+    if cache is None:
+        return np.asarray(compute(texts), dtype=np.float32)
+    return cache.get_many(texts, compute)
 
-    def get_e5_embedding(text, tokenizer, model):
-        input_ids = tokenizer(f"query: {text}", return_tensors="pt", padding=True, truncation=True)
-        with torch.no_grad():
-            model_output = model(**input_ids)
-        embeddings = model_output.last_hidden_state[:, 0]
-        return F.normalize(embeddings, p=2, dim=1)
+def encode_e5(texts, tokenizer, model, cache=None, batch_size=E5_BATCH_SIZE):
+    """
+    Encodes texts with E5 as L2-normalized "query:" embeddings, reusing cached
+    embeddings when a cache is given.
 
-    e5_master = get_e5_embedding(master_text, tokenizer, model)
-    e5_student = get_e5_embedding(student_text, tokenizer, model)
-    return F.cosine_similarity(e5_master, e5_student).item()
+    Texts are sorted by length and run in padded batches of batch_size, so
+    similar-length texts share a forward pass and padding stays small.
+    """
+    def compute(batch):
+        order = sorted(range(len(batch)), key=lambda i: len(batch[i]))
+        embeddings = [None] * len(batch)
+        for start in range(0, len(order), batch_size):
+            chunk = order[start:start + batch_size]
+            inputs = tokenizer(
+                [f"query: {batch[i]}" for i in chunk], return_tensors="pt", padding=True, truncation=True
+            )
+            with torch.inference_mode():
+                model_output = model(**inputs)
+            vectors = F.normalize(model_output.last_hidden_state[:, 0], p=2, dim=1).numpy()
+            for i, vec in zip(chunk, vectors):
+                embeddings[i] = vec
+        return np.stack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+
+    if cache is None:
+        return compute(texts)
+    return cache.get_many(texts, compute)
+
+def batch_cosine_scores(master_vec, student_matrix):
+    """Cosine similarity of one master vector against each row of student_matrix."""
+    master_vec = np.asarray(master_vec, dtype=np.float32)
+    student_matrix = np.asarray(student_matrix, dtype=np.float32).reshape(-1, master_vec.shape[0])
+    norms = np.linalg.norm(student_matrix, axis=1) * np.linalg.norm(master_vec)
+    return np.divide(student_matrix @ master_vec, norms, out=np.zeros(len(student_matrix), dtype=np.float32), where=norms > 0)
+
+def calculate_sbert_similarity(master_text, student_text, sbert_model, cache=None):
+    sbert_master, sbert_student = encode_sbert([master_text, student_text], sbert_model, cache)
+    return cosine_similarity(sbert_master, sbert_student)
+
+def calculate_e5_similarity(master_text, student_text, tokenizer, model, cache=None):
+    """
+    Calculates the E5 cosine similarity between two texts.
+    """
+    e5_master, e5_student = encode_e5([master_text, student_text], tokenizer, model, cache)
+    return cosine_similarity(e5_master, e5_student)
 
 def calculate_final_score(equation_score, sbert_score, e5_score):
     # Weights for each component
@@ -40,4 +98,3 @@ def calculate_final_score(equation_score, sbert_score, e5_score):
     ) * 10
 
     return round(final_score, 1)  # Round to 1 decimal
-
@@ -1,12 +1,60 @@
 # utils.py
 
 import re
+from functools import lru_cache
 
-def replace_equations_with_descriptions(text, equations):
-    for eq in equations:
-        original_eq = eq.get('raw_equation') or eq['equation']
-        description = eq['description']
-        # Escape equation text to avoid regex issues
-        pattern = re.escape(original_eq.strip())
-        text = re.sub(pattern, description, text, flags=re.IGNORECASE)
-    return text
+
+class EquationMatcher:
+    """
+    One compiled, case-insensitive alternation over all equation strings
+    (longest first), so every equation is replaced in a single scan and
+    inserted descriptions are never re-matched.
+    """
+
+    def __init__(self, replacements: dict):
+        # replacements maps lower-cased equation text -> description
+        self.replacements = replacements
+        alternation = "|".join(re.escape(eq) for eq in sorted(replacements, key=len, reverse=True))
+        self.pattern = re.compile(alternation, flags=re.IGNORECASE)
+
+    def _replace(self, match):
+        found = match.group(0)
+        description = self.replacements.get(found.lower())
+        if description is None:
+            # Case folding the regex engine accepted but str.lower() maps differently
+            description = next(
+                (desc for eq, desc in self.replacements.items() if eq.casefold() == found.casefold()), found
+            )
+        return description
+
+    def sub(self, text: str) -> str:
+        return self.pattern.sub(self._replace, text)
+
+
+@lru_cache(maxsize=1024)
+def _compile(pairs: tuple):
+    replacements = {}
+    for equation, description in pairs:
+        # First description wins, as with the old one-re.sub-per-equation loop
+        replacements.setdefault(equation.lower(), description)
+    return EquationMatcher(replacements) if replacements else None
+
+
+def compile_equation_matcher(equations):
+    """
+    Builds (or fetches from cache) the matcher for a list of extractions.
+    Returns None when there is nothing to replace.
+    """
+    pairs = tuple(
+        ((eq.get('raw_equation') or eq['equation']).strip(), eq['description'])
+        for eq in equations
+        if (eq.get('raw_equation') or eq['equation']).strip()
+    )
+    return _compile(pairs)
+
+
+def replace_equations_with_descriptions(text, equations, matcher=None):
+    matcher = matcher or compile_equation_matcher(equations)
+    if matcher is None:
+        return text
+    return matcher.sub(text)
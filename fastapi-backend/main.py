@@ -1,30 +1,181 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
-from azure.cosmos import CosmosClient
-from core.model import analyze_question_from_db  # ✅ Import from model.py
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from core.model import (  # ✅ Import from model.py
+    analyze_question_from_db_async,
+    analyze_question_all_students_async,
+    astream_grade_students,
+    afetch_question_answers_from_cosmos,
+    awarm_master_profile,
+    start_model_loading,
+    configure_scoring_executor,
+    shutdown_scoring_executor,
+    model_status,
+    models_ready,
+)
+from core.jobs import JobStore, JobWorkerPool, JobQueueFull
+from core.ingest import AnswerLog
+from core import metrics
+from core.fakes import OFFLINE_MODE, InMemoryContainer
+from core.cosmos import (
+    CosmosConnection, MASTER_CONTAINER_NAME, STUDENT_CONTAINER_NAME, aread_master_answer, check_partition_keys
+)
+from core.logs import configure_logging
 
 import os
 import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import anyio.to_thread
+
+# Leveled logging for the service (LOG_LEVEL, LOG_FORMAT=text|json)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Threads for blocking work (asyncio.to_thread and run_in_threadpool); 0 keeps the library defaults
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0"))
+
+def configure_worker_threads(threads: int):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=threads, thread_name_prefix="worker"))
+    anyio.to_thread.current_default_thread_limiter().total_tokens = threads
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WORKER_THREADS:
+        configure_worker_threads(WORKER_THREADS)
+    # Models load in the background so the worker accepts requests (and /ready) immediately
+    start_model_loading()
+    configure_scoring_executor()
+    await open_containers()
+    await job_pool.start()
+    metrics_sync = asyncio.create_task(metrics.sync_caches_periodically())
+    yield
+    metrics_sync.cancel()
+    await job_pool.stop()
+    await cosmos.close()
+    shutdown_scoring_executor()
+    metrics.mark_process_dead()
 
 
 app = FastAPI(
     title="Answer Storage API",
     version="1.0",
-    description="API to save master and student answers"
+    description="API to save master and student answers",
+    lifespan=lifespan
 )
 
-# Cosmos DB config
-COSMOS_ENDPOINT = os.getenv("COSMOS_ENDPOINT")
-COSMOS_KEY = os.getenv("COSMOS_KEY")
-DATABASE_NAME = "tutor"
-MASTER_CONTAINER_NAME = "masteranswer"
-STUDENT_CONTAINER_NAME = "studentanswer"
+# Per-request stage timings in a Server-Timing response header (opt in, it exposes internals)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+async def server_timing(request: Request, call_next):
+    with metrics.track_request() as timings:
+        response = await call_next(request)
+    # Streaming responses only carry the stages that ran before the first chunk
+    if timings.stages:
+        response.headers["Server-Timing"] = timings.header()
+    return response
+
+if SERVER_TIMING:
+    app.middleware("http")(server_timing)
+
+# Cosmos DB: one async client and connection pool per worker, opened at startup
+cosmos = CosmosConnection()
+master_container = None
+student_container = None
+
+def load_offline_containers(seed_path: str = None):
+    # In-memory containers for OFFLINE_MODE, optionally seeded from {"masteranswer": [...], "studentanswer": [...]}
+    seed = {}
+    if seed_path:
+        with open(seed_path, encoding="utf-8") as f:
+            seed = json.load(f)
+    return (
+        InMemoryContainer(seed.get(MASTER_CONTAINER_NAME, [])),
+        InMemoryContainer(seed.get(STUDENT_CONTAINER_NAME, [])),
+    )
+
+async def open_containers():
+    global master_container, student_container
+    if OFFLINE_MODE:
+        master, student = load_offline_containers(os.getenv("OFFLINE_SEED_PATH"))
+        master_container, student_container = master.aio, student.aio
+    else:
+        await cosmos.open()
+        master_container, student_container = cosmos.master_container, cosmos.student_container
+    await check_partition_keys(master_container, student_container)
 
-cosmos_client = CosmosClient(COSMOS_ENDPOINT, COSMOS_KEY)
-database = cosmos_client.get_database_client(DATABASE_NAME)
-master_container = database.get_container_client(MASTER_CONTAINER_NAME)
-student_container = database.get_container_client(STUDENT_CONTAINER_NAME)
+
+async def run_analyze_job(params: dict):
+    # One student when userId is given, otherwise the whole class
+    if params.get("userId"):
+        result = await analyze_question_from_db_async(
+            params["questionId"], params["userId"], master_container, student_container
+        )
+    else:
+        result = await analyze_question_all_students_async(params["questionId"], master_container, student_container)
+    if "error" in result:
+        raise ValueError(result["error"])
+    return result
+
+
+async def run_grade_stored_job(params: dict):
+    # Grades answers uploaded through /store-answers (all stored students unless userIds is given)
+    stored = await run_in_threadpool(answer_log.read, params["questionId"])
+    if not stored["master_answer"]:
+        raise ValueError("No master answer stored for this question.")
+    user_ids = params.get("userIds") or list(stored["students"])
+    student_data = [
+        {"userId": uid, "answerText": stored["students"][uid]} for uid in user_ids if uid in stored["students"]
+    ]
+    results = [None] * len(student_data)
+    duplicate_info = {}
+    async for index, result in astream_grade_students(
+        params["questionId"], stored["master_answer"], student_data, duplicate_info=duplicate_info
+    ):
+        results[index] = result
+    return {"questionId": params["questionId"], "results": results, "duplicate_clusters": duplicate_info.get("clusters", [])}
+
+
+async def run_warm_master_job(params: dict):
+    # Master answer from the upload log, or from Cosmos for masters written by other services
+    question_id = params["questionId"]
+    if params.get("source") == "cosmos":
+        master_answer = await aread_master_answer(master_container, question_id)
+    else:
+        master_answer = (await run_in_threadpool(answer_log.read, question_id))["master_answer"]
+    if not master_answer:
+        raise ValueError("Master answer not found.")
+    return await awarm_master_profile(question_id, master_answer)
+
+
+# Uploaded answers: append-only segment log per question (see core/ingest.py)
+answer_log = AnswerLog(
+    os.getenv("ANSWER_LOG_DIR", "storage/answers"),
+    compact_after=int(os.getenv("ANSWER_LOG_COMPACT_SEGMENTS", "16"))
+)
+# Records per segment written by the NDJSON upload, and the longest accepted line
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_MAX_LINE_BYTES = int(os.getenv("INGEST_MAX_LINE_BYTES", str(1024 * 1024)))
+
+# Background analysis jobs (persisted in SQLite so they survive restarts)
+job_store = JobStore(
+    os.getenv("JOB_DB_PATH", "storage/jobs.db"),
+    max_pending=int(os.getenv("JOB_QUEUE_MAX_PENDING", "100")),
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "60")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+)
+job_pool = JobWorkerPool(
+    job_store,
+    {"analyze": run_analyze_job, "grade_stored": run_grade_stored_job, "warm_master": run_warm_master_job},
+    concurrency=int(os.getenv("JOB_CONCURRENCY", "2")),
+    retention_seconds=float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+)
 
 # Request schema
 class StudentAnswer(BaseModel):
@@ -36,42 +187,219 @@ class AnswerUploadRequest(BaseModel):
     master_answer: str
     student_answers: List[StudentAnswer]
 
+class AnalyzeJobRequest(BaseModel):
+    questionId: str
+    userId: Optional[str] = None
+
+async def queue_job(kind: str, params: dict):
+    # Follow-up work for an upload; the upload still succeeds if the queue is full
+    try:
+        job_id = await run_in_threadpool(job_store.submit, kind, params)
+    except JobQueueFull:
+        return None
+    job_pool.notify()
+    return job_id
+
 # ✅ POST endpoint to store master + student answers
 @app.post("/store-answers")
-def store_answers(payload: AnswerUploadRequest):
+async def store_answers(payload: AnswerUploadRequest, grade: bool = False):
     if not payload.master_answer.strip():
         raise HTTPException(status_code=400, detail="Master answer cannot be empty.")
     if not payload.student_answers:
         raise HTTPException(status_code=400, detail="Student answers list cannot be empty.")
 
-    # ✅ Save full payload to file
-    os.makedirs("storage", exist_ok=True)
-    file_path = f"storage/{payload.questionId}.json"
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(payload.dict(), f, indent=2)
+    # ✅ Append to the question's segment log off the event loop
+    pairs = [(s.student_id, s.answer_text) for s in payload.student_answers]
+    await run_in_threadpool(answer_log.append, payload.questionId, payload.master_answer, pairs)
 
-    return {
+    response = {
         "message": "Master and student answers saved successfully.",
         "questionId": payload.questionId,
-        "student_count": len(payload.student_answers)
+        "student_count": len(payload.student_answers),
+        # Precompute the master profile now instead of on the first analysis
+        "warmup_job_id": await queue_job("warm_master", {"questionId": payload.questionId, "source": "upload"})
+    }
+    if grade:
+        response["job_id"] = await queue_job(
+            "grade_stored", {"questionId": payload.questionId, "userIds": [uid for uid, _ in pairs]}
+        )
+    return response
+
+async def iter_ndjson_lines(request: Request):
+    # Splits the request body into lines as it arrives, without buffering the whole upload
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > INGEST_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Line longer than {INGEST_MAX_LINE_BYTES} bytes.")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+# ✅ POST endpoint to stream answers as NDJSON: {"master_answer": ...} and/or {"student_id": ..., "answer_text": ...} lines
+@app.post("/store-answers/{question_id}/stream")
+async def store_answers_stream(question_id: str, request: Request, grade: bool = False):
+    stored_ids = []
+    master_stored = False
+    records_written = 0
+    errors = []
+    invalid = 0
+    master_answer = None
+    batch = []
+
+    async def flush():
+        nonlocal master_answer, batch, records_written, master_stored
+        records_written += await run_in_threadpool(answer_log.append, question_id, master_answer, batch)
+        master_stored = master_stored or master_answer is not None
+        stored_ids.extend(uid for uid, _ in batch)
+        master_answer, batch = None, []
+
+    line_number = 0
+    async for line in iter_ndjson_lines(request):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if "master_answer" in record:
+                if not str(record["master_answer"]).strip():
+                    raise ValueError("Master answer cannot be empty.")
+                master_answer = record["master_answer"]
+            else:
+                answer = StudentAnswer(**record)
+                batch.append((answer.student_id, answer.answer_text))
+        except (ValueError, TypeError) as e:
+            # pydantic's ValidationError is a ValueError; report the first few bad lines
+            invalid += 1
+            if len(errors) < 20:
+                errors.append({"line": line_number, "error": str(e)})
+            continue
+        if len(batch) >= INGEST_BATCH_SIZE:
+            await flush()
+    if batch or master_answer is not None:
+        await flush()
+
+    if not records_written and invalid:
+        raise HTTPException(status_code=400, detail={"message": "No valid answers in upload.", "errors": errors})
+
+    response = {
+        "message": "Answers saved successfully.",
+        "questionId": question_id,
+        "student_count": len(stored_ids),
+        "invalid_lines": invalid,
+        "errors": errors,
     }
+    if master_stored:
+        response["warmup_job_id"] = await queue_job("warm_master", {"questionId": question_id, "source": "upload"})
+    if grade and stored_ids:
+        response["job_id"] = await queue_job("grade_stored", {"questionId": question_id, "userIds": stored_ids})
+    return response
+
+# ✅ Readiness probe with per-model load state
+@app.get("/ready")
+def ready(response: Response):
+    if not models_ready():
+        response.status_code = 503
+    return {"ready": models_ready(), "models": model_status()}
+
+# ✅ Prometheus metrics (stage timings, LLM calls/retries/tokens, cache hit rates)
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
 
 # ✅ GET endpoint to analyze and generate feedback
 @app.get("/analyze/{question_id}/{user_id}")
-def run_analysis_from_db(question_id: str, user_id: str):
+async def run_analysis_from_db(question_id: str, user_id: str, response: Response):
     try:
-        result = analyze_question_from_db(
+        cache_info = {}
+        result = await analyze_question_from_db_async(
             question_id,
             user_id,
             master_container=master_container,
-            student_container=student_container
+            student_container=student_container,
+            cache_info=cache_info
         )
         if "error" in result:
             raise HTTPException(status_code=404, detail=result["error"])
+        # HIT, MISS or PARTIAL (some students served from the result cache)
+        response.headers["X-Cache"] = cache_info.get("status", "MISS")
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ✅ POST endpoint to queue an analysis as a background job
+@app.post("/jobs/analyze", status_code=202)
+async def submit_analysis_job(payload: AnalyzeJobRequest):
+    try:
+        job_id = await run_in_threadpool(job_store.submit, "analyze", payload.dict())
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    job_pool.notify()
+    return {"job_id": job_id, "status": "pending"}
+
+# ✅ POST endpoint to precompute a master profile after the master answer changed in Cosmos
+@app.post("/masters/{question_id}/warm", status_code=202)
+async def warm_master_profile(question_id: str):
+    try:
+        job_id = await run_in_threadpool(job_store.submit, "warm_master", {"questionId": question_id, "source": "cosmos"})
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    job_pool.notify()
+    return {"job_id": job_id, "status": "pending"}
+
+# ✅ GET endpoint to poll a job's status and result
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+# ✅ POST endpoint to grade every student of a question, streamed as results finish
+@app.post("/analyze/{question_id}/batch")
+async def run_batch_analysis(question_id: str, request: Request, format: str = None):
+    with metrics.timed("cosmos_fetch"):
+        data = await afetch_question_answers_from_cosmos(question_id, master_container, student_container)
+    if "error" in data:
+        raise HTTPException(status_code=404, detail=data["error"])
+
+    # NDJSON by default; Server-Sent Events with ?format=sse or Accept: text/event-stream
+    use_sse = format == "sse" or (format is None and "text/event-stream" in request.headers.get("accept", ""))
+
+    async def stream():
+        graded = 0
+        duplicate_info = {}
+        try:
+            async for _, result in astream_grade_students(
+                question_id, data["master_answer"], data["student_answers"], duplicate_info=duplicate_info
+            ):
+                graded += 1
+                line = json.dumps(result)
+                yield f"event: result\ndata: {line}\n\n" if use_sse else line + "\n"
+        except Exception as e:
+            # The 200 status is already sent, so a failure (e.g. the master profile build) ends the stream with an error event
+            logger.exception("Batch analysis of %s failed after %d results", question_id, graded)
+            error = json.dumps({"type": "error", "questionId": question_id, "student_count": graded, "error": str(e)})
+            yield f"event: error\ndata: {error}\n\n" if use_sse else error + "\n"
+            return
+        summary = json.dumps({
+            "questionId": question_id,
+            "done": True,
+            "student_count": graded,
+            # Groups of near-identical answers (copy signal for teachers)
+            "duplicate_clusters": duplicate_info.get("clusters", []),
+        })
+        yield f"event: done\ndata: {summary}\n\n" if use_sse else summary + "\n"
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    # X-Accel-Buffering stops nginx from buffering the stream
+    return StreamingResponse(stream(), media_type=media_type, headers={"X-Accel-Buffering": "no"})
+
 
 # # ✅ GET endpoint to analyze and generate feedback
 # @app.get("/analyze/{question_id}")
@@ -0,0 +1,271 @@
+# benchmark.py
+"""
+Benchmarks the grading pipeline offline, with no Gemini or Cosmos access.
+
+Generates a synthetic class of N students x M equations, seeds in-memory
+Cosmos containers, and grades it with the fake chat and embedding models
+from core/fakes.py (deterministic, with configurable latency). SBERT/E5 are
+the real models unless --fake-encoders is given.
+
+Each mode runs in its own process so caches start cold and peak RSS is per
+mode:
+    sync    analyze_question_from_db, one student after another
+    async   analyze_question_from_db_async for every student at once
+    class   analyze_question_all_students_async (the background-job path)
+
+The in-memory containers are partitioned by questionId like production;
+--partition-key sets the service's COSMOS_*_PARTITION_KEY (default unset,
+i.e. cross-partition queries; "/questionId" for point reads).
+
+Reported per mode: wall time, students/second, per-stage latency (count,
+total, mean), peak RSS and call counts. Save with --output and compare
+two commits with --compare.
+
+Usage (from fastapi-backend/):
+    python scripts/benchmark.py --students 30 --equations 5 --llm-latency 0.2 --output bench.json
+    python scripts/benchmark.py --fake-encoders --compare bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ("sync", "async", "class")
+QUESTION_ID = "bench-q1"
+
+_FILLER = [
+    "This follows from the definitions introduced earlier.",
+    "We assume the system is isolated and friction can be ignored.",
+    "Substituting the known values gives the result.",
+    "The units on both sides are consistent.",
+    "This relation holds for small angles only.",
+]
+
+
+def make_equation(k: int):
+    # Compact "lhs=rhs" equations, so the fake extractor finds them; the second form is a symbolic rewrite
+    forms = [
+        (f"v{k}=a{k}*t{k}", f"a{k}*t{k}=v{k}"),
+        (f"F{k}=m{k}*g{k}", f"F{k}=g{k}*m{k}"),
+        (f"p{k}=m{k}*u{k}", f"u{k}*m{k}=p{k}"),
+        (f"E{k}=m{k}*c{k}^2", f"E{k}=c{k}^2*m{k}"),
+    ]
+    return forms[k % len(forms)]
+
+
+def make_class(students: int, equations: int, seed: int, duplicate_rate: float = 0.0):
+    """
+    Builds a master answer with the given number of equations and student
+    answers that each state a random subset of them (verbatim, rewritten,
+    or replaced by an unrelated equation). With duplicate_rate, that share
+    of students hand in a copy of an earlier student's answer.
+    """
+    rng = random.Random(seed)
+    pairs = [make_equation(k) for k in range(equations)]
+    master_sentences = [f"We use {eq}. {rng.choice(_FILLER)}" for eq, _ in pairs]
+    master = {"questionId": QUESTION_ID, "answerText": " ".join(master_sentences)}
+
+    student_items = []
+    for s in range(students):
+        if student_items and rng.random() < duplicate_rate:
+            copied = rng.choice(student_items)
+            student_items.append(dict(copied, userId=f"student-{s}"))
+            continue
+        sentences = []
+        for k, (eq, rewritten) in enumerate(pairs):
+            roll = rng.random()
+            if roll < 0.5:
+                sentences.append(f"We know {eq}.")
+            elif roll < 0.7:
+                sentences.append(f"Equivalently {rewritten}.")
+            elif roll < 0.85:
+                sentences.append(f"I think w{k}=z{k}+{s}.")
+            sentences.append(rng.choice(_FILLER))
+        student_items.append({
+            "questionId": QUESTION_ID,
+            "userId": f"student-{s}",
+            "answerText": " ".join(sentences),
+        })
+    return master, student_items
+
+
+def run_mode(mode: str, students: int, equations: int, seed: int, duplicate_rate: float = 0.0):
+    from core import fakes, metrics
+    from core.fakes import InMemoryContainer
+    from core.model import (
+        analyze_question_from_db,
+        analyze_question_from_db_async,
+        analyze_question_all_students_async,
+    )
+
+    master, student_items = make_class(students, equations, seed, duplicate_rate)
+    master_container = InMemoryContainer([master])
+    student_container = InMemoryContainer(student_items)
+    user_ids = [item["userId"] for item in student_items]
+
+    duplicate_clusters = None
+    start = time.perf_counter()
+    if mode == "sync":
+        responses = [
+            analyze_question_from_db(QUESTION_ID, uid, master_container, student_container) for uid in user_ids
+        ]
+        results = [r for response in responses for r in response.get("results", [])]
+    elif mode == "async":
+        async def run_all():
+            return await asyncio.gather(*(
+                analyze_question_from_db_async(QUESTION_ID, uid, master_container.aio, student_container.aio)
+                for uid in user_ids
+            ))
+        responses = asyncio.run(run_all())
+        results = [r for response in responses for r in response.get("results", [])]
+    else:
+        response = asyncio.run(
+            analyze_question_all_students_async(QUESTION_ID, master_container.aio, student_container.aio)
+        )
+        results = response.get("results", [])
+        duplicate_clusters = len(response.get("duplicate_clusters", []))
+    wall_seconds = time.perf_counter() - start
+
+    stages = {
+        stage: {"count": count, "total_seconds": round(total, 4), "mean_seconds": round(total / count, 5)}
+        for (stage,), (count, total) in sorted(metrics.histogram_totals(metrics.stage_seconds).items())
+    }
+    scores = [r.get("final_score") for r in results]
+    return {
+        "mode": mode,
+        "students": students,
+        "graded": sum(1 for r in results if "error" not in r),
+        "wall_seconds": round(wall_seconds, 4),
+        "students_per_second": round(students / wall_seconds, 2) if wall_seconds else None,
+        "mean_final_score": round(sum(s for s in scores if s is not None) / max(len(scores), 1), 3),
+        "reused_from_duplicates": sum(1 for r in results if "duplicate_of" in r),
+        "duplicate_clusters": duplicate_clusters,
+        "stages": stages,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "calls": dict(
+            sorted(fakes.call_counts.items()),
+            cosmos_queries=master_container.query_count + student_container.query_count,
+            cosmos_point_reads=master_container.read_count + student_container.read_count,
+            cosmos_cross_partition_queries=master_container.cross_partition_count + student_container.cross_partition_count,
+            llm_retries=int(sum(metrics.sample_value("tutor_llm_retries_total", call=call) for call in ("extract", "feedback"))),
+            e5_skipped=int(metrics.sample_value("tutor_scorers_skipped_total", scorer="e5", reason="decided")),
+            template_feedback=int(metrics.sample_value("tutor_feedback_total", kind="template")),
+        ),
+    }
+
+
+def run_in_subprocess(mode: str, args):
+    env = dict(
+        os.environ,
+        OFFLINE_MODE="1",
+        FAKE_ENCODERS="1" if args.fake_encoders else "0",
+        FAKE_LLM_LATENCY_SECONDS=str(args.llm_latency),
+        FAKE_EMBEDDING_LATENCY_SECONDS=str(args.embedding_latency),
+        # Measure grading, not the result cache or stored profiles; load models before the clock starts
+        RESULT_CACHE_ENABLED="0",
+        EMBEDDING_CACHE_DIR="",
+        MASTER_PROFILE_DIR="",
+        MODEL_LOAD_MODE="eager",
+        COSMOS_MASTER_PARTITION_KEY=args.partition_key,
+        COSMOS_STUDENT_PARTITION_KEY=args.partition_key,
+    )
+    # Metrics stay in-process so the report can read them (prometheus_client goes multiprocess if the variable exists at all)
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    command = [
+        sys.executable, os.path.abspath(__file__), "--run-mode", mode,
+        "--students", str(args.students), "--equations", str(args.equations), "--seed", str(args.seed),
+        "--duplicate-rate", str(args.duplicate_rate),
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True, env=env).stdout
+    # The report is the last line; the pipeline prints progress before it
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict):
+    # Ratios > 1 mean this run is slower (or bigger) than the baseline
+    previous = {run["mode"]: run for run in baseline.get("runs", [])}
+    rows = []
+    for run in report["runs"]:
+        old = previous.get(run["mode"])
+        if old is None:
+            continue
+        rows.append({
+            "mode": run["mode"],
+            "wall_ratio": round(run["wall_seconds"] / old["wall_seconds"], 3),
+            "peak_rss_ratio": round(run["peak_rss_mb"] / old["peak_rss_mb"], 3),
+            "stage_mean_ratio": {
+                stage: round(stats["mean_seconds"] / old["stages"][stage]["mean_seconds"], 3)
+                for stage, stats in run["stages"].items()
+                if old["stages"].get(stage, {}).get("mean_seconds")
+            },
+        })
+    return {"baseline_commit": baseline.get("commit"), "modes": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--equations", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Seconds per fake Gemini call")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Seconds per fake embedding call")
+    parser.add_argument("--fake-encoders", action="store_true", help="Replace SBERT/E5 with hash-based fakes")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="Share of students who copy an earlier answer")
+    parser.add_argument("--partition-key", default="", help='Partition key path the service is configured with (e.g. "/questionId")')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path to write the report as JSON")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.run_mode, args.students, args.equations, args.seed, args.duplicate_rate)))
+        return
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "params": {
+            "students": args.students,
+            "equations": args.equations,
+            "llm_latency": args.llm_latency,
+            "embedding_latency": args.embedding_latency,
+            "fake_encoders": args.fake_encoders,
+            "seed": args.seed,
+            "duplicate_rate": args.duplicate_rate,
+            "partition_key": args.partition_key,
+            "encoder_backend": os.getenv("ENCODER_BACKEND", "torch"),
+            "scoring_policy": os.getenv("SCORING_POLICY_PATH"),
+        },
+        "runs": [run_in_subprocess(mode, args) for mode in args.modes],
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# benchmark_inference.py
+"""
+Compares SBERT/E5 encoding under concurrent load: in-process (every request
+runs its own forward pass, as each API worker does without INFERENCE_SOCKET)
+against the shared inference worker with micro-batching.
+
+Both modes send --requests encode requests of --texts-per-request texts
+from --concurrency threads. Each mode runs in its own process; the worker
+mode also starts scripts/inference_worker.py on a temporary socket.
+
+Reported per mode: requests/second, p50/p99 latency, peak RSS and, for the
+worker, how many requests and texts went into each forward pass.
+
+Usage (from fastapi-backend/):
+    python scripts/benchmark_inference.py --model e5 --requests 200 --concurrency 16
+    python scripts/benchmark_inference.py --fake-encoders --max-wait-ms 2
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ("in-process", "worker")
+
+_WORDS = (
+    "the velocity of the block increases as the net force acts on it while friction opposes "
+    "the motion and energy is conserved in the isolated system so the momentum stays constant"
+).split()
+
+
+def make_texts(count: int, seed: int):
+    # Distinct sentences of 8-60 words, so batches need real padding
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 60))) + f" ({i})" for i in range(count)]
+
+
+def percentile(values, q: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def local_encoder(model: str):
+    from core.model import sbert_model, e5_tokenizer, e5_model
+    from core.scorers import encode_sbert, encode_e5
+
+    if model == "sbert":
+        sbert_model.get()
+        return lambda texts: encode_sbert(texts, sbert_model)
+    e5_tokenizer.get()
+    e5_model.get()
+    return lambda texts: encode_e5(texts, e5_tokenizer, e5_model)
+
+
+def run_mode(mode: str, args):
+    if mode == "worker":
+        from core.inference import InferenceClient
+        client = InferenceClient(args.socket)
+        encode = lambda texts: client.encode(args.model, texts)
+    else:
+        encode = local_encoder(args.model)
+
+    texts = make_texts(args.requests * args.texts_per_request, args.seed)
+    requests = [texts[i:i + args.texts_per_request] for i in range(0, len(texts), args.texts_per_request)]
+    encode(make_texts(4, args.seed + 1))  # warm up
+
+    def timed(batch):
+        start = time.perf_counter()
+        encode(batch)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(timed, requests))
+    wall_seconds = time.perf_counter() - start
+
+    report = {
+        "mode": mode,
+        "requests": len(requests),
+        "wall_seconds": round(wall_seconds, 4),
+        "requests_per_second": round(len(requests) / wall_seconds, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if mode == "worker":
+        stats = client.stats()
+        batches = stats["stats"].get(args.model, {})
+        report["worker_peak_rss_mb"] = stats["peak_rss_mb"]
+        report["batches"] = batches.get("batches", 0)
+        report["mean_requests_per_batch"] = round(batches.get("requests", 0) / max(batches.get("batches", 0), 1), 2)
+        report["mean_texts_per_batch"] = round(batches.get("texts", 0) / max(batches.get("batches", 0), 1), 2)
+    return report
+
+
+def wait_for_worker(socket_path: str, worker, timeout: float = 600):
+    from core.inference import InferenceClient
+
+    client = InferenceClient(socket_path, timeout=5)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if worker.poll() is not None:
+            raise RuntimeError("Inference worker exited before it started listening.")
+        if client.status()["state"] == "ready":
+            return
+        time.sleep(0.2)
+    raise TimeoutError("Inference worker did not start in time.")
+
+
+def run_in_subprocess(mode: str, args, env: dict):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--run-mode", mode, "--model", args.model,
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+        "--texts-per-request", str(args.texts_per_request), "--seed", str(args.seed), "--socket", args.socket,
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=("sbert", "e5"), default="e5")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--texts-per-request", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--fake-encoders", action="store_true", help="Replace SBERT/E5 with hash-based fakes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path to write the report as JSON")
+    parser.add_argument("--socket", default=os.path.join(tempfile.gettempdir(), f"tutor-inference-{os.getpid()}.sock"))
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.run_mode, args)))
+        return
+
+    env = dict(os.environ, FAKE_ENCODERS="1" if args.fake_encoders else "0", MODEL_LOAD_MODE="lazy")
+    env.pop("INFERENCE_SOCKET", None)
+    runs = []
+    for mode in args.modes:
+        if mode == "in-process":
+            runs.append(run_in_subprocess(mode, args, env))
+            continue
+        worker = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference_worker.py"),
+             "--socket", args.socket, "--max-batch", str(args.max_batch), "--max-wait-ms", str(args.max_wait_ms)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_worker(args.socket, worker)
+            runs.append(run_in_subprocess(mode, args, env))
+        finally:
+            worker.terminate()
+            worker.wait()
+
+    report = {
+        "params": {
+            "model": args.model,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "texts_per_request": args.texts_per_request,
+            "max_batch": args.max_batch,
+            "max_wait_ms": args.max_wait_ms,
+            "fake_encoders": args.fake_encoders,
+            "encoder_backend": os.getenv("ENCODER_BACKEND", "torch"),
+        },
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
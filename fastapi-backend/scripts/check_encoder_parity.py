@@ -0,0 +1,184 @@
+# check_encoder_parity.py
+"""
+Checks that the int8 and ONNX encoder backends score like fp32 PyTorch.
+
+Each backend runs in its own process (so peak memory is measured per
+backend) and scores a fixture set of master/student pairs with SBERT and
+E5. Cosine scores and the resulting calculate_final_score must stay within
+the given tolerances of the fp32 "torch" backend; the script exits with
+status 1 otherwise. Encode latency and peak RSS are reported alongside.
+
+Usage (from fastapi-backend/):
+    python scripts/check_encoder_parity.py
+    python scripts/check_encoder_parity.py --backends int8 --fixtures pairs.json --output parity.json
+
+A fixtures file is a JSON list of {"master": ..., "student": ..., "equation_score": ...}.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_FIXTURES = [
+    {
+        "master": "Newton's second law states that force equals mass times acceleration, F = ma.",
+        "student": "The net force on a body is its mass multiplied by its acceleration (F = m a).",
+        "equation_score": 1.0,
+    },
+    {
+        "master": "Kinetic energy is one half of mass times velocity squared, KE = 1/2 m v^2.",
+        "student": "Kinetic energy depends on mass and speed.",
+        "equation_score": 0.0,
+    },
+    {
+        "master": "Ohm's law relates voltage, current and resistance: V = IR.",
+        "student": "Voltage is current times resistance, so doubling the resistance doubles the voltage at fixed current.",
+        "equation_score": 1.0,
+    },
+    {
+        "master": "The period of a simple pendulum is T = 2*pi*sqrt(L/g), independent of the mass of the bob.",
+        "student": "A heavier pendulum swings more slowly.",
+        "equation_score": 0.0,
+    },
+    {
+        "master": "Momentum is conserved in a closed system: m1 v1 + m2 v2 = m1 v1' + m2 v2'.",
+        "student": "In a collision with no external forces the total momentum before equals the total momentum after.",
+        "equation_score": 0.5,
+    },
+    {
+        "master": "The ideal gas law is PV = nRT, linking pressure, volume, amount of gas and temperature.",
+        "student": "Photosynthesis turns light energy into chemical energy in plants.",
+        "equation_score": 0.0,
+    },
+    {
+        "master": "Work done by a constant force is W = F d cos(theta).",
+        "student": "Work equals force times displacement times the cosine of the angle between them, W = F d cos(theta).",
+        "equation_score": 1.0,
+    },
+    {
+        "master": "Gravitational potential energy near the surface is U = mgh.",
+        "student": "Potential energy is mass times g times height.",
+        "equation_score": 1.0,
+    },
+]
+
+
+def run_backend(backend: str, fixtures, repeats: int):
+    # Imported here so the backend is picked up from the environment of this process
+    os.environ["ENCODER_BACKEND"] = backend
+    from core.model import SBERT_MODEL_NAME, E5_MODEL_NAME, _load_e5_tokenizer, _load_e5_torch_model
+    from core.encoders import load_sbert, load_e5
+    from core.scorers import encode_sbert, encode_e5, batch_cosine_scores, calculate_final_score
+
+    sbert_model = load_sbert(SBERT_MODEL_NAME, backend)
+    tokenizer = _load_e5_tokenizer()
+    e5_model = load_e5(E5_MODEL_NAME, _load_e5_torch_model, tokenizer, backend)
+
+    texts = [text for pair in fixtures for text in (pair["master"], pair["student"])]
+    # Warm up once (ONNX Runtime and quantized kernels do lazy setup), then time
+    encode_sbert(texts, sbert_model)
+    encode_e5(texts, tokenizer, e5_model)
+
+    timings = {"sbert": [], "e5": []}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        sbert_vectors = encode_sbert(texts, sbert_model)
+        timings["sbert"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        e5_vectors = encode_e5(texts, tokenizer, e5_model)
+        timings["e5"].append(time.perf_counter() - start)
+
+    results = []
+    for i, pair in enumerate(fixtures):
+        sbert = float(batch_cosine_scores(sbert_vectors[2 * i], sbert_vectors[2 * i + 1:2 * i + 2])[0])
+        e5 = float(batch_cosine_scores(e5_vectors[2 * i], e5_vectors[2 * i + 1:2 * i + 2])[0])
+        results.append({
+            "sbert": sbert,
+            "e5": e5,
+            "final_score": calculate_final_score(pair.get("equation_score", 0.0), sbert, e5),
+        })
+
+    return {
+        "backend": backend,
+        "scores": results,
+        "sbert_seconds": round(min(timings["sbert"]), 4),
+        "e5_seconds": round(min(timings["e5"]), 4),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_in_subprocess(backend: str, fixtures_path, repeats: int):
+    command = [sys.executable, os.path.abspath(__file__), "--run-backend", backend, "--repeats", str(repeats)]
+    if fixtures_path:
+        command += ["--fixtures", fixtures_path]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    # The report is the last line; model loading may print before it
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(reference, candidate, tolerance: float, score_tolerance: float):
+    max_diff = {"sbert": 0.0, "e5": 0.0, "final_score": 0.0}
+    for ref, cand in zip(reference["scores"], candidate["scores"]):
+        for key in max_diff:
+            max_diff[key] = max(max_diff[key], abs(ref[key] - cand[key]))
+    passed = (
+        max_diff["sbert"] <= tolerance
+        and max_diff["e5"] <= tolerance
+        and max_diff["final_score"] <= score_tolerance
+    )
+    return {
+        "backend": candidate["backend"],
+        "passed": passed,
+        "max_abs_diff": {key: round(value, 5) for key, value in max_diff.items()},
+        "sbert_speedup": round(reference["sbert_seconds"] / candidate["sbert_seconds"], 2),
+        "e5_speedup": round(reference["e5_seconds"] / candidate["e5_seconds"], 2),
+        "peak_rss_ratio": round(candidate["peak_rss_mb"] / reference["peak_rss_mb"], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx"])
+    parser.add_argument("--fixtures", help="JSON list of master/student pairs (defaults to a built-in set)")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Max abs difference in cosine scores")
+    parser.add_argument("--score-tolerance", type=float, default=0.2, help="Max abs difference in final score (0-10)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Optional path to write the report as JSON")
+    parser.add_argument("--run-backend", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_backend:
+        fixtures = DEFAULT_FIXTURES
+        if args.fixtures:
+            with open(args.fixtures, encoding="utf-8") as f:
+                fixtures = json.load(f)
+        print(json.dumps(run_backend(args.run_backend, fixtures, args.repeats)))
+        return
+
+    reference = run_in_subprocess("torch", args.fixtures, args.repeats)
+    candidates = [run_in_subprocess(backend, args.fixtures, args.repeats) for backend in args.backends]
+    report = {
+        "reference": {key: reference[key] for key in ("sbert_seconds", "e5_seconds", "peak_rss_mb")},
+        "backends": [
+            dict(compare(reference, candidate, args.tolerance, args.score_tolerance),
+                 **{key: candidate[key] for key in ("sbert_seconds", "e5_seconds", "peak_rss_mb")})
+            for candidate in candidates
+        ],
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if not all(result["passed"] for result in report["backends"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
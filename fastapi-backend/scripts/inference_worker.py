@@ -0,0 +1,65 @@
+# inference_worker.py
+"""
+Runs the SBERT/E5 inference worker (core/inference.py) on a Unix socket.
+
+The worker loads the encoders once (ENCODER_BACKEND, FAKE_ENCODERS and
+MODEL_MMAP_WEIGHTS apply as usual) before it starts listening. Point the
+API workers at the same socket with INFERENCE_SOCKET and they stop loading
+SBERT/E5 themselves; scripts/measure_startup.py shows the difference in
+per-worker memory.
+
+Usage (from fastapi-backend/):
+    python scripts/inference_worker.py --socket /tmp/tutor-inference.sock
+    INFERENCE_SOCKET=/tmp/tutor-inference.sock uvicorn main:app --workers 4
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The worker listens on INFERENCE_SOCKET but always encodes locally: take it out of the
+# environment before core.inference reads it, or core.model would route encoding back here
+INFERENCE_SOCKET = os.environ.pop("INFERENCE_SOCKET", None)
+
+from core.inference import INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS, InferenceServer
+from core.logs import configure_logging
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=INFERENCE_SOCKET or "/tmp/tutor-inference.sock")
+    parser.add_argument("--max-batch", type=int, default=INFERENCE_MAX_BATCH, help="Most texts per forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=INFERENCE_MAX_WAIT_MS,
+                        help="How long a request may wait for others to join its batch")
+    args = parser.parse_args()
+
+    configure_logging()
+    from core.model import ENCODER_MODELS, sbert_model, e5_tokenizer, e5_model
+    from core.scorers import encode_sbert, encode_e5
+
+    for model in ENCODER_MODELS:
+        model.get()
+
+    server = InferenceServer(
+        args.socket,
+        {
+            "sbert": lambda texts: encode_sbert(texts, sbert_model),
+            "e5": lambda texts: encode_e5(texts, e5_tokenizer, e5_model),
+        },
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+    )
+    # docker stop sends SIGTERM; exit through the normal shutdown path so the socket is removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
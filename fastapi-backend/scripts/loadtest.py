@@ -0,0 +1,350 @@
+# loadtest.py
+"""
+Load-tests the HTTP API under concurrent /analyze and /store-answers traffic.
+
+By default each configuration starts its own uvicorn with the offline
+stand-ins (OFFLINE_MODE: fake Gemini with --llm-latency, in-memory Cosmos
+seeded with a synthetic class) and real SBERT/E5 unless --fake-encoders is
+given. Configurations are the product of --workers (uvicorn processes),
+--torch-threads (TORCH_NUM_THREADS) and --worker-threads (WORKER_THREADS,
+the thread pool for blocking work). Each one is driven by a closed loop of
+--concurrency clients per step, for --duration seconds per step, with a
+--mix of analyze and store requests.
+
+Reported per step: throughput, latency percentiles per route, errors,
+queueing (client latency minus the server's own Server-Timing total, i.e.
+time spent waiting for a worker) and server CPU: busy share of the
+available cores and per-worker CPU. The "knee" is the first step where
+throughput stops growing (< 10%) while p99 latency at least doubles.
+
+To go through nginx instead (docker-compose), write the seed, start the
+stack with OFFLINE_MODE=1, OFFLINE_SEED_PATH pointing at it and
+SERVER_TIMING=1, and pass --target:
+    python scripts/loadtest.py --write-seed seed.json
+    python scripts/loadtest.py --target http://localhost/api --concurrency 8 32
+
+Usage (from fastapi-backend/):
+    python scripts/loadtest.py --fake-encoders --concurrency 1 4 16 --duration 10
+    python scripts/loadtest.py --workers 1 2 4 --torch-threads 1 2 --concurrency 8 32 --output load.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import make_class
+from measure_startup import child_pids, read_memory_kb
+
+ROUTES = ("analyze", "store")
+_SERVER_TOTAL_RE = re.compile(r"total;dur=([0-9.]+)")
+
+
+def make_seed(questions: int, students: int, equations: int, seed: int):
+    """Offline Cosmos contents: {"masteranswer": [...], "studentanswer": [...]} for several questions."""
+    masters, answers = [], []
+    for q in range(questions):
+        question_id = f"load-q{q}"
+        master, student_items = make_class(students, equations, seed + q)
+        masters.append(dict(master, questionId=question_id))
+        answers.extend(dict(item, questionId=question_id) for item in student_items)
+    return {"masteranswer": masters, "studentanswer": answers}
+
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+
+def latency_summary(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 0.5),
+        "p90_ms": percentile(latencies, 0.9),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": round(max(latencies), 2) if latencies else None,
+    }
+
+
+def cpu_seconds(pids):
+    # utime + stime from /proc/<pid>/stat (Linux only)
+    total = 0.0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (FileNotFoundError, IndexError):
+            pass
+    return total
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """A uvicorn process running the app offline with one configuration."""
+
+    def __init__(self, config: dict, args, seed_path: str, work_dir: str):
+        self.config = config
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(
+            os.environ,
+            OFFLINE_MODE="1",
+            OFFLINE_SEED_PATH=seed_path,
+            FAKE_ENCODERS="1" if args.fake_encoders else "0",
+            FAKE_LLM_LATENCY_SECONDS=str(args.llm_latency),
+            FAKE_EMBEDDING_LATENCY_SECONDS=str(args.embedding_latency),
+            RESULT_CACHE_ENABLED="1" if args.result_cache else "0",
+            SERVER_TIMING="1",
+            LOG_LEVEL="WARNING",
+            # Each configuration starts cold in its own directory, away from storage/
+            EMBEDDING_CACHE_DIR="",
+            JOB_DB_PATH=os.path.join(work_dir, "jobs.db"),
+            RESULT_CACHE_PATH=os.path.join(work_dir, "results.db"),
+            ANSWER_LOG_DIR=os.path.join(work_dir, "answers"),
+            MASTER_PROFILE_DIR=os.path.join(work_dir, "profiles"),
+            PROMETHEUS_MULTIPROC_DIR=os.path.join(work_dir, "prometheus"),
+        )
+        if config["torch_threads"]:
+            env["TORCH_NUM_THREADS"] = str(config["torch_threads"])
+        if config["worker_threads"]:
+            env["WORKER_THREADS"] = str(config["worker_threads"])
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--workers", str(config["workers"]),
+             "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env=env,
+        )
+
+    def wait_ready(self, timeout: float):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.url}/ready", timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.3)
+        raise TimeoutError("Server did not become ready in time.")
+
+    def pids(self):
+        # With --workers > 1 uvicorn runs a supervisor plus one child per worker
+        return [self.process.pid] + child_pids(self.process.pid)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def store_payload(rng: random.Random, question_id: str, students: int):
+    return {
+        "questionId": question_id,
+        "master_answer": "We use F=m*a and v=a*t.",
+        "student_answers": [
+            {"student_id": f"upload-{rng.randrange(10**6)}", "answer_text": "F=m*a so the block accelerates."}
+            for _ in range(students)
+        ],
+    }
+
+
+async def drive(base_url: str, concurrency: int, duration: float, mix: dict, seed: dict, args):
+    """Runs concurrency closed-loop clients for duration seconds and returns one record per request."""
+    pairs = [(item["questionId"], item["userId"]) for item in seed["studentanswer"]]
+    routes, weights = zip(*mix.items())
+    records = []
+    deadline = time.perf_counter() + duration
+
+    async def client(worker: int):
+        rng = random.Random(args.seed * 1000 + worker)
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0]
+            start = time.perf_counter()
+            try:
+                if route == "analyze":
+                    question_id, user_id = rng.choice(pairs)
+                    response = await http.get(f"{base_url}/analyze/{question_id}/{user_id}")
+                else:
+                    payload = store_payload(rng, f"load-upload-{worker}", args.store_students)
+                    response = await http.post(f"{base_url}/store-answers", json=payload)
+                status = response.status_code
+                match = _SERVER_TOTAL_RE.search(response.headers.get("server-timing", ""))
+                server_ms = float(match.group(1)) if match else None
+            except httpx.HTTPError as e:
+                status, server_ms = type(e).__name__, None
+            latency_ms = (time.perf_counter() - start) * 1000
+            records.append({"route": route, "status": status, "latency_ms": latency_ms, "server_ms": server_ms})
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=args.request_timeout, limits=limits) as http:
+        await asyncio.gather(*(client(worker) for worker in range(concurrency)))
+    return records
+
+
+def run_step(base_url: str, concurrency: int, args, mix: dict, seed: dict, server: Server = None):
+    pids = server.pids() if server else []
+    cpu_before = cpu_seconds(pids)
+    start = time.perf_counter()
+    records = asyncio.run(drive(base_url, concurrency, args.duration, mix, seed, args))
+    wall = time.perf_counter() - start
+    cpu_used = cpu_seconds(pids) - cpu_before
+
+    ok = [r for r in records if r["status"] == 200]
+    errors = {}
+    for r in records:
+        if r["status"] != 200:
+            errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+    queue_ms = [r["latency_ms"] - r["server_ms"] for r in ok if r["server_ms"] is not None]
+    step = {
+        "concurrency": concurrency,
+        "requests": len(records),
+        "errors": errors,
+        "throughput_rps": round(len(ok) / wall, 2),
+        "latency": latency_summary([r["latency_ms"] for r in ok]),
+        "routes": {
+            route: latency_summary([r["latency_ms"] for r in ok if r["route"] == route])
+            for route in mix if mix[route] > 0
+        },
+        "queue": {"p50_ms": percentile(queue_ms, 0.5), "p99_ms": percentile(queue_ms, 0.99)},
+    }
+    if server:
+        workers = [pid for pid in pids if pid != server.process.pid] or pids
+        step["server"] = {
+            # Share of the machine's cores the server kept busy; near 1.0 means CPU-saturated
+            "cpu_utilization": round(cpu_used / (wall * os.cpu_count()), 3),
+            "cpu_seconds_per_worker": round(cpu_used / max(len(workers), 1), 2),
+            "rss_mb": round(sum(read_memory_kb(pid)["rss_kb"] or 0 for pid in pids) / 1024, 1),
+        }
+    return step
+
+
+def find_knee(steps):
+    # First step where throughput grows < 10% while p99 at least doubles
+    for previous, step in zip(steps, steps[1:]):
+        if not previous["throughput_rps"] or not previous["latency"]["p99_ms"] or not step["latency"]["p99_ms"]:
+            continue
+        if step["throughput_rps"] < 1.1 * previous["throughput_rps"] and step["latency"]["p99_ms"] >= 2 * previous["latency"]["p99_ms"]:
+            return step["concurrency"]
+    return None
+
+
+def parse_mix(text: str):
+    # "analyze=9,store=1" -> {"analyze": 9.0, "store": 1.0}
+    mix = {}
+    for part in text.split(","):
+        route, _, weight = part.partition("=")
+        if route not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown route {route!r}; expected one of {', '.join(ROUTES)}")
+        mix[route] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=15, help="Seconds per concurrency step")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of traffic before measuring each configuration")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("analyze=9,store=1"))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="uvicorn worker processes")
+    parser.add_argument("--torch-threads", type=int, nargs="+", default=[0], help="TORCH_NUM_THREADS (0: torch default)")
+    parser.add_argument("--worker-threads", type=int, nargs="+", default=[0], help="WORKER_THREADS (0: library default)")
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--students", type=int, default=20, help="Seeded students per question")
+    parser.add_argument("--equations", type=int, default=4)
+    parser.add_argument("--store-students", type=int, default=5, help="Student answers per /store-answers request")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds per fake Gemini call")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per fake embedding call")
+    parser.add_argument("--fake-encoders", action="store_true", help="Replace SBERT/E5 with hash-based fakes")
+    parser.add_argument("--result-cache", action="store_true", help="Keep the result cache on (repeat requests become cache hits)")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--ready-timeout", type=float, default=600)
+    parser.add_argument("--target", help="Base URL of a running deployment instead of starting one")
+    parser.add_argument("--write-seed", help="Write the offline Cosmos seed to this path and exit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path to write the report as JSON")
+    args = parser.parse_args()
+
+    seed = make_seed(args.questions, args.students, args.equations, args.seed)
+    if args.write_seed:
+        with open(args.write_seed, "w", encoding="utf-8") as f:
+            json.dump(seed, f)
+        return
+
+    configs = [
+        {"workers": w, "torch_threads": t, "worker_threads": n}
+        for w, t, n in itertools.product(args.workers, args.torch_threads, args.worker_threads)
+    ]
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as work_dir:
+        seed_path = os.path.join(work_dir, "seed.json")
+        with open(seed_path, "w", encoding="utf-8") as f:
+            json.dump(seed, f)
+
+        for index, config in enumerate([None] if args.target else configs):
+            server = None
+            if config is not None:
+                # Fresh job queue, answer log, profiles and result cache per configuration
+                run_dir = os.path.join(work_dir, f"run-{index}")
+                os.makedirs(run_dir)
+                server = Server(config, args, seed_path, run_dir)
+            try:
+                if server:
+                    server.wait_ready(args.ready_timeout)
+                base_url = args.target.rstrip("/") if args.target else server.url
+                if args.warmup:
+                    # Builds master profiles and fills the embedding caches before the clock starts
+                    asyncio.run(drive(base_url, min(args.concurrency), args.warmup, args.mix, seed, args))
+                steps = [run_step(base_url, c, args, args.mix, seed, server) for c in args.concurrency]
+            finally:
+                if server:
+                    server.stop()
+            runs.append({"config": config or {"target": args.target}, "steps": steps, "knee_concurrency": find_knee(steps)})
+            print(json.dumps(runs[-1]), file=sys.stderr)
+
+    report = {
+        "params": {
+            "mix": args.mix,
+            "duration": args.duration,
+            "questions": args.questions,
+            "students": args.students,
+            "llm_latency": args.llm_latency,
+            "embedding_latency": args.embedding_latency,
+            "fake_encoders": args.fake_encoders,
+            "result_cache": args.result_cache,
+            "cpu_count": os.cpu_count(),
+            "encoder_backend": os.getenv("ENCODER_BACKEND", "torch"),
+        },
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# measure_startup.py
+"""
+Measures FastAPI cold start and per-worker memory.
+
+Starts uvicorn with the given number of workers, records how long it takes
+until the server accepts requests and until /ready reports every model
+loaded, then prints RSS and PSS (which splits shared pages such as
+memory-mapped weights between processes) for each worker.
+
+Usage (from fastapi-backend/):
+    python scripts/measure_startup.py --workers 2
+    MODEL_MMAP_WEIGHTS=1 python scripts/measure_startup.py --workers 2
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def read_memory_kb(pid: int):
+    # RSS from /proc/<pid>/status, PSS from smaps_rollup (Linux only)
+    memory = {"rss_kb": None, "pss_kb": None}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    memory["rss_kb"] = int(line.split()[1])
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    memory["pss_kb"] = int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return memory
+
+
+def child_pids(pid: int):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def get_ready(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", help="Optional path to write the measurements as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--workers", str(args.workers)],
+        env=os.environ.copy(),
+    )
+    url = f"http://127.0.0.1:{args.port}/ready"
+    accepting_seconds = None
+    ready_seconds = None
+    models = None
+
+    try:
+        while time.perf_counter() - start < args.timeout:
+            status, body = get_ready(url)
+            if status is not None and accepting_seconds is None:
+                accepting_seconds = time.perf_counter() - start
+            if status == 200:
+                ready_seconds = time.perf_counter() - start
+                models = body.get("models")
+                break
+            time.sleep(0.2)
+
+        # With --workers > 1 uvicorn runs a supervisor plus one child per worker
+        worker_pids = child_pids(server.pid) if args.workers > 1 else [server.pid]
+        workers = [{"pid": pid, **read_memory_kb(pid)} for pid in worker_pids]
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    report = {
+        "workers": args.workers,
+        "mmap_weights": os.getenv("MODEL_MMAP_WEIGHTS", "0") == "1",
+        "accepting_seconds": round(accepting_seconds, 3) if accepting_seconds else None,
+        "ready_seconds": round(ready_seconds, 3) if ready_seconds else None,
+        "models": models,
+        "worker_memory": workers,
+        "total_pss_mb": round(sum(w["pss_kb"] or 0 for w in workers) / 1024, 1),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
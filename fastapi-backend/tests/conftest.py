@@ -0,0 +1,30 @@
+"""
+Runs the test suite against the offline fakes (core/fakes.py): no Gemini,
+Cosmos DB or model weights needed. Run from fastapi-backend/ with
+`python -m pytest tests`.
+"""
+
+import os
+import sys
+import tempfile
+
+# The services read their configuration at import time, so it is set here
+# before any test module imports core or main.
+_storage = tempfile.mkdtemp(prefix="grader-tests-")
+os.environ.update({
+    "OFFLINE_MODE": "1",
+    "FAKE_ENCODERS": "1",
+    "FAKE_LLM_LATENCY_SECONDS": "0",
+    "FAKE_EMBEDDING_LATENCY_SECONDS": "0",
+    "MODEL_LOAD_MODE": "eager",
+    "RESULT_CACHE_ENABLED": "0",
+    "MASTER_PROFILE_DIR": "",
+    "EMBEDDING_CACHE_DIR": "",
+    "ANSWER_LOG_DIR": os.path.join(_storage, "answers"),
+    "JOB_DB_PATH": os.path.join(_storage, "jobs.db"),
+    "SERVER_TIMING": "1",
+})
+for name in ("PROMETHEUS_MULTIPROC_DIR", "SCORING_POLICY_PATH", "INFERENCE_SOCKET", "SCORING_PROCESSES"):
+    os.environ.pop(name, None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
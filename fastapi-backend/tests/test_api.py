@@ -0,0 +1,53 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from core import model
+from core.fakes import InMemoryContainer
+
+QUESTION_ID = "q-api"
+MASTER = {"questionId": QUESTION_ID, "answerText": "Speed is distance over time: v=d/t. Then d=v*t gives the distance."}
+STUDENTS = [
+    {"questionId": QUESTION_ID, "userId": "a", "answerText": "The speed is v=d/t, so the distance is d=v*t."},
+    {"questionId": QUESTION_ID, "userId": "b", "answerText": "Distance is d=v*t because speed is v=d/t."},
+]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    with TestClient(main.app) as client:
+        monkeypatch.setattr(main, "master_container", InMemoryContainer([MASTER]).aio)
+        monkeypatch.setattr(main, "student_container", InMemoryContainer(STUDENTS).aio)
+        yield client
+
+
+def test_server_timing_includes_scoring_stages(client):
+    # The first request builds the master profile, which encodes with SBERT/E5 itself
+    client.get(f"/analyze/{QUESTION_ID}/a")
+    response = client.get(f"/analyze/{QUESTION_ID}/b")
+
+    assert response.status_code == 200
+    stages = [entry.split(";")[0].strip() for entry in response.headers["Server-Timing"].split(",")]
+    assert "sbert" in stages
+    assert "e5" in stages
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "sse"])
+def test_batch_stream_ends_with_error_event(client, monkeypatch, fmt):
+    async def failing_profile(question_id, master_answer, abuild):
+        raise RuntimeError("profile store unavailable")
+
+    monkeypatch.setattr(model.master_profiles, "aget_or_build", failing_profile)
+    response = client.post(f"/analyze/{QUESTION_ID}/batch", params={"format": fmt})
+
+    assert response.status_code == 200
+    if fmt == "sse":
+        event, data = response.text.strip().split("\n\n")[-1].split("\n")
+        assert event == "event: error"
+        last = json.loads(data[len("data: "):])
+    else:
+        last = json.loads(response.text.strip().split("\n")[-1])
+    assert last["type"] == "error"
+    assert last["error"] == "profile store unavailable"
@@ -0,0 +1,58 @@
+import asyncio
+import copy
+
+from core import model
+from core.extractors import process_extractions
+
+MASTER = "Speed is distance over time: v=d/t. Then d=v*t gives the distance."
+ANSWER = "The speed is v=d/t, so the distance is d=v*t."
+
+
+def grade(student_data, monkeypatch):
+    graded = {}
+
+    def record(profile, student_entry, student_extractions):
+        result = original(profile, student_entry, student_extractions)
+        graded[student_entry["userId"]] = copy.deepcopy(result)
+        return result
+
+    original = model.grade_student_equations
+    monkeypatch.setattr(model, "grade_student_equations", record)
+
+    async def collect():
+        results = [None] * len(student_data)
+        async for i, result in model.astream_grade_students("q-duplicates", MASTER, student_data):
+            results[i] = result
+        return results
+    results = asyncio.run(collect())
+    monkeypatch.setattr(model, "grade_student_equations", original)
+    return results, graded
+
+
+def test_duplicate_is_graded_like_its_representative(monkeypatch):
+    # The fake extractor returns equations that are already normalized;
+    # rewrite them so a second normalization pass would show
+    monkeypatch.setattr(model, "normalize_equation", str.upper)
+    (alone,), graded_alone = grade([{"userId": "a", "answerText": ANSWER}], monkeypatch)
+    (representative, duplicate), graded = grade([
+        {"userId": "a", "answerText": ANSWER},
+        {"userId": "b", "answerText": ANSWER},
+    ], monkeypatch)
+
+    assert duplicate["duplicate_of"] == "a"
+    for student_id, result in (("a", representative), ("b", duplicate)):
+        assert "error" not in result
+        assert result["final_score"] == alone["final_score"]
+        assert graded[student_id]["extractions"] == graded_alone["a"]["extractions"]
+        assert graded[student_id]["descriptive_text"] == graded_alone["a"]["descriptive_text"]
+        assert graded[student_id]["final_equation_score"] == graded_alone["a"]["final_equation_score"]
+
+
+def test_process_extractions_is_idempotent():
+    extractions = [{"equation": "v = d / t"}]
+    process_extractions(extractions, lambda eq: eq.replace(" ", "").upper())
+    once = [dict(eq) for eq in extractions]
+    process_extractions(extractions, lambda eq: eq.replace(" ", "").upper())
+
+    assert extractions == once
+    assert extractions[0]["raw_equation"] == "v = d / t"
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from core.policy import ScoringPolicy, load_policy
+from core.scorers import calculate_final_score
+
+EARLY_STOP_POLICY = os.path.join(os.path.dirname(os.path.dirname(__file__)), "policies", "early_stop.json")
+
+# (equation, sbert, e5) where the early-stop policy would skip E5
+CLEAR_CUT = [(1.0, 0.96, 0.72), (1.0, 0.9, 0.98), (0.6, 0.5, 0.75), (0.8, 0.9, 0.72)]
+
+
+@pytest.mark.parametrize("equation, sbert, e5", CLEAR_CUT)
+def test_default_policy_matches_calculate_final_score(equation, sbert, e5):
+    policy = ScoringPolicy()
+    partial = {"equation": equation, "sbert": sbert}
+
+    assert load_policy(EARLY_STOP_POLICY).decided(partial)
+    assert not policy.decided(partial)
+    assert policy.final_score({**partial, "e5": e5}) == calculate_final_score(equation, sbert, e5)
+
+
+def test_default_policy_always_asks_the_llm():
+    policy = ScoringPolicy()
+
+    assert not any(policy.use_template(name) for _, name in policy.verdicts)
+    assert policy.use_template("Fair", blank=True)
+
+
+def test_early_stop_policy_is_opt_in():
+    policy = load_policy(EARLY_STOP_POLICY)
+
+    assert policy.early_stop
+    assert policy.use_template("Outstanding")
+    assert policy.version != ScoringPolicy().version